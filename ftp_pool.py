@@ -0,0 +1,133 @@
+from __future__ import print_function
+
+import re
+import time
+import socket
+import ftplib
+import threading
+from io import BytesIO
+from collections import defaultdict
+
+try:
+    from urllib.parse import urlparse
+    from urllib.request import URLError
+except ImportError:
+    from urlparse import urlparse
+    from urllib2 import URLError
+
+
+class FTPPool(object):
+    def __init__(self, max_per_host=4, timeout=30, retries=3, backoff=0.5, max_idle=60):
+        self._max_per_host = max_per_host
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_idle = max_idle
+
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)
+        self._slots = {}
+
+    def fetch(self, url):
+        def retrieve(ftp, path):
+            buf = BytesIO()
+            ftp.retrbinary("RETR %s" % path, buf.write)
+            return buf.getvalue()
+
+        return self._run(url, retrieve)
+
+    def listing(self, url):
+        def list_dir(ftp, path):
+            lines = []
+            ftp.retrlines("LIST %s" % path, lines.append)
+            return "\n".join(lines)
+
+        return self._run(url, list_dir)
+
+    def close(self):
+        with self._lock:
+            idle = [ ftp for conns in self._idle.values() for ftp, last_used in conns ]
+            self._idle.clear()
+
+        for ftp in idle:
+            self._close(ftp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self, url, action):
+        parsed = urlparse(url)
+        if parsed.scheme != 'ftp':
+            raise ValueError("FTPPool can't fetch '%s'" % url)
+
+        key = (parsed.hostname, parsed.port or ftplib.FTP_PORT, parsed.username or 'anonymous', parsed.password or '')
+        path = re.sub("/+", "/", parsed.path) or "/"
+
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self._max_per_host)
+            slot = self._slots[key]
+
+        for attempt in range(self._retries + 1):
+            with slot:
+                ftp = None
+                try:
+                    ftp = self._checkout(key)
+                    result = action(ftp, path)
+                except ftplib.error_perm as exc:
+                    # Permanent errors (e.g. no such file) won't go away by retrying, but the connection is fine.
+                    if ftp is not None:
+                        self._checkin(key, ftp)
+                    raise URLError(exc)
+                except (ftplib.Error, socket.error, EOFError) as exc:
+                    if ftp is not None:
+                        self._close(ftp)
+
+                    if attempt == self._retries:
+                        raise URLError(exc)
+                else:
+                    self._checkin(key, ftp)
+                    return result
+
+            time.sleep(self._backoff * 2 ** attempt)
+
+    def _checkout(self, key):
+        now = time.time()
+        stale = []
+        ftp = None
+
+        with self._lock:
+            idle = self._idle[key]
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self._max_idle:
+                    ftp = conn
+                    break
+                stale.append(conn)
+
+        for conn in stale:
+            self._close(conn)
+
+        if ftp is None:
+            host, port, user, passwd = key
+            ftp = ftplib.FTP(timeout=self._timeout)
+            try:
+                ftp.connect(host, port)
+                ftp.login(user, passwd)
+            except:
+                ftp.close()
+                raise
+        return ftp
+
+    def _checkin(self, key, ftp):
+        with self._lock:
+            self._idle[key].append((ftp, time.time()))
+
+    def _close(self, ftp):
+        try:
+            ftp.quit()
+        except (ftplib.Error, socket.error, EOFError):
+            ftp.close()
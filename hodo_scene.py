@@ -0,0 +1,333 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import json
+from xml.sax.saxutils import escape
+
+from params import vec2comp, as_profile
+
+_seg_hghts = [0, 3, 6, 9, 12, 18]
+_seg_colors = ['#ff0000', '#00ff00', '#008800', '#993399', '#00bfbf']
+
+_scene_exts = ['.svg', '.json']
+
+# Same layout as the PNG: a 10 x 7.5 in figure at 100 pixels per inch.
+_fig_width, _fig_height = 1000, 750
+_axes_left, _axes_top, _axes_size = 50, 37.5, 675
+
+
+def frame_bounds(data, fixed=False):
+    u, v = data.u, data.v
+
+    if fixed or len(u) == 0:
+        ctr_u, ctr_v = 20, 20
+        size = 120
+    else:
+        ctr_u = u.mean()
+        ctr_v = v.mean()
+        size = max(u.max() - u.min(), v.max() - v.min()) + 20
+        size = max(120, size)
+
+    min_u = ctr_u - size / 2
+    max_u = ctr_u + size / 2
+    min_v = ctr_v - size / 2
+    max_v = ctr_v + size / 2
+    return min_u, max_u, min_v, max_v
+
+
+def range_rings(min_u, max_u, min_v, max_v):
+    max_ring = int(np.ceil(max(
+        np.hypot(min_u, min_v),
+        np.hypot(min_u, max_v),
+        np.hypot(max_u, min_v),
+        np.hypot(max_u, max_v)
+    )))
+
+    rings = []
+    for irng in range(10, max_ring, 10):
+        rng_str = None
+        if irng <= max_u - 10:
+            rng_str = "%d kts" % irng if max_u - 20 < irng <= max_u - 10 else "%d" % irng
+        rings.append((irng, rng_str))
+    return rings
+
+
+def hodo_layers(data, parameters):
+    storm_dir, storm_spd = parameters['storm_motion']
+    bl_dir, bl_spd = parameters['bunkers_left']
+    br_dir, br_spd = parameters['bunkers_right']
+    mn_dir, mn_spd = parameters['mean_wind']
+
+    u, v = data.u, data.v
+    alt = data.altitude
+
+    storm_u, storm_v = vec2comp(storm_dir, storm_spd)
+    bl_u, bl_v = vec2comp(bl_dir, bl_spd)
+    br_u, br_v = vec2comp(br_dir, br_spd)
+    mn_u, mn_v = vec2comp(mn_dir, mn_spd)
+
+    seg_idxs = np.searchsorted(alt, _seg_hghts)
+    try:
+        seg_u, seg_v = data.interp_wind(_seg_hghts)
+        ca_u, ca_v = data.interp_wind(0.5)
+    except ValueError:
+        seg_u = np.nan * np.array(_seg_hghts)
+        seg_v = np.nan * np.array(_seg_hghts)
+        ca_u = np.nan
+        ca_v = np.nan
+
+    mkr_z = np.arange(16)
+    try:
+        mkr_u, mkr_v = data.interp_wind(mkr_z)
+    except ValueError:
+        mkr_u = np.nan * mkr_z
+        mkr_v = np.nan * mkr_z
+
+    solid_segs, solid_colors = [], []
+    dashed_segs, dashed_colors = [], []
+    circ_idxs = []
+
+    def add_seg(segs, colors, seg_u, seg_v, color):
+        if len(seg_u) > 1:
+            segs.append(np.column_stack((seg_u, seg_v)))
+            colors.append(color)
+
+    for idx in range(len(_seg_hghts) - 1):
+        idx_start = seg_idxs[idx]
+        idx_end = seg_idxs[idx + 1]
+        color = _seg_colors[idx]
+
+        if not np.isnan(seg_u[idx]):
+            add_seg(solid_segs, solid_colors, [seg_u[idx], u[idx_start]], [seg_v[idx], v[idx_start]], color)
+
+        if idx_start < len(data['rms_error']) and data['rms_error'][idx_start] == 0.:
+            # The first segment is to the surface wind, draw it in a dashed line
+            add_seg(dashed_segs, dashed_colors, u[idx_start:(idx_start + 2)], v[idx_start:(idx_start + 2)], color)
+            add_seg(solid_segs, solid_colors, u[(idx_start + 1):idx_end], v[(idx_start + 1):idx_end], color)
+        else:
+            add_seg(solid_segs, solid_colors, u[idx_start:idx_end], v[idx_start:idx_end], color)
+
+        if not np.isnan(seg_u[idx + 1]):
+            add_seg(solid_segs, solid_colors, [u[idx_end - 1], seg_u[idx + 1]], [v[idx_end - 1], seg_v[idx + 1]], color)
+
+        circ_idxs.extend([ idx ] * len(u[idx_start:idx_end]))
+
+    circ_slice = slice(seg_idxs[0], seg_idxs[0] + len(circ_idxs))
+    circ_rads = np.sqrt(2) * np.asarray(data['rms_error'][circ_slice])
+    circ_colors = [ _seg_colors[idx] for idx in circ_idxs ]
+
+    try:
+        storm_line = ([storm_u, u[0]], [storm_v, v[0]])
+        critical_line = ([u[0], ca_u], [v[0], ca_v])
+    except IndexError:
+        storm_line = None
+        critical_line = None
+
+    vectors = []
+    if not (np.isnan(bl_u) or np.isnan(bl_v)):
+        vectors.append(('LM', bl_u, bl_v))
+
+    if not (np.isnan(br_u) or np.isnan(br_v)):
+        vectors.append(('RM', br_u, br_v))
+
+    if not (np.isnan(mn_u) or np.isnan(mn_v)):
+        vectors.append(('MEAN', mn_u, mn_v))
+
+    smv_is_brm = (storm_u == br_u and storm_v == br_v)
+    smv_is_blm = (storm_u == bl_u and storm_v == bl_v)
+    smv_is_mnw = (storm_u == mn_u and storm_v == mn_v)
+
+    if not (np.isnan(storm_u) or np.isnan(storm_v)) and not (smv_is_brm or smv_is_blm or smv_is_mnw):
+        vectors.append(('SM', storm_u, storm_v))
+
+    return {
+        'solid': (solid_segs, solid_colors),
+        'dashed': (dashed_segs, dashed_colors),
+        'circles': (u[circ_slice], v[circ_slice], circ_rads, circ_colors),
+        'markers': (mkr_u, mkr_v, mkr_z),
+        'storm_line': storm_line,
+        'critical_line': critical_line,
+        'vectors': vectors,
+    }
+
+
+def _param_table(parameters):
+    def fmt_scalar(name):
+        return "--" if np.isnan(parameters[name]) else "%d" % int(parameters[name])
+
+    def fmt_vector(name):
+        return "--" if np.isnan(parameters[name]).any() else "%03d/%02d kts" % tuple(parameters[name])
+
+    critical = "--" if np.isnan(parameters['critical']) else "%d deg" % int(parameters['critical'])
+
+    return [
+        ["", "BWD (kts)", "SRH (m2 s-2)"],
+        ["0-1 km", fmt_scalar('shear_mag_1000m'), fmt_scalar('srh_1000m')],
+        ["0-3 km", fmt_scalar('shear_mag_3000m'), fmt_scalar('srh_3000m')],
+        ["0-6 km", fmt_scalar('shear_mag_6000m'), ""],
+        ["Storm Motion:", fmt_vector('storm_motion')],
+        ["Bunkers Left Mover:", fmt_vector('bunkers_left')],
+        ["Bunkers Right Mover:", fmt_vector('bunkers_right')],
+        ["0-6 km Mean Wind:", fmt_vector('mean_wind')],
+        ["Critical Angle:", critical],
+    ]
+
+
+def _round(vals, precision=2):
+    # NaN isn't valid JSON, so missing values become nulls.
+    vals = np.round(np.asarray(vals, dtype=float), precision)
+    return [ None if np.isnan(val) else float(val) for val in np.atleast_1d(vals) ]
+
+
+def hodograph_scene(data, parameters, fixed=False):
+    data = as_profile(data)
+    min_u, max_u, min_v, max_v = frame_bounds(data, fixed=fixed)
+    layers = hodo_layers(data, parameters)
+
+    segments = []
+    for style in ['dashed', 'solid']:
+        for seg, color in zip(*layers[style]):
+            segments.append({'style': style, 'color': color, 'u': _round(seg[:, 0]), 'v': _round(seg[:, 1])})
+
+    circ_u, circ_v, circ_rads, circ_colors = layers['circles']
+    mkr_u, mkr_v, mkr_z = layers['markers']
+    mkr_ok = ~np.isnan(mkr_u)
+
+    lines = []
+    for name, color in [('storm_line', '#00bfbf'), ('critical_line', '#bf00bf')]:
+        if layers[name] is not None:
+            line_u, line_v = layers[name]
+            lines.append({'name': name, 'color': color, 'u': _round(line_u), 'v': _round(line_v)})
+
+    params = {}
+    for name, val in parameters.items():
+        params[name] = _round(val) if np.ndim(val) > 0 else _round(val)[0]
+
+    return {
+        'radar_id': data.rid,
+        'valid_time': data['time'].strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'title': "%s VWP valid %s" % (data.rid, data['time'].strftime("%d %b %Y %H%M UTC")),
+        'bounds': {'min_u': float(min_u), 'max_u': float(max_u), 'min_v': float(min_v), 'max_v': float(max_v)},
+        'rings': [ {'radius': rng, 'label': label} for rng, label in range_rings(min_u, max_u, min_v, max_v) ],
+        'segments': segments,
+        'circles': {'u': _round(circ_u), 'v': _round(circ_v), 'r': _round(circ_rads), 'color': circ_colors},
+        'markers': {'u': _round(mkr_u[mkr_ok]), 'v': _round(mkr_v[mkr_ok]), 'label': [ str(z) for z in mkr_z[mkr_ok] ]},
+        'lines': lines,
+        'vectors': [ {'name': name, 'u': _round(vu)[0], 'v': _round(vv)[0]} for name, vu, vv in layers['vectors'] ],
+        'parameters': params,
+        'table': _param_table(parameters),
+    }
+
+
+def scene_to_svg(scene):
+    bounds = scene['bounds']
+    min_u, max_u = bounds['min_u'], bounds['max_u']
+    min_v, max_v = bounds['min_v'], bounds['max_v']
+    scale = _axes_size / (max_u - min_u)
+
+    def x(u):
+        return _axes_left + (u - min_u) * scale
+
+    def y(v):
+        return _axes_top + (max_v - v) * scale
+
+    def path(us, vs):
+        cmds = []
+        pen_up = True
+        for u, v in zip(us, vs):
+            if u is None or v is None:
+                pen_up = True
+                continue
+            cmds.append("%s%.1f %.1f" % ("M" if pen_up else "L", x(u), y(v)))
+            pen_up = False
+        return " ".join(cmds)
+
+    svg = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d" font-family="sans-serif">'
+            % (_fig_width, _fig_height, _fig_width, _fig_height),
+        '<defs><clipPath id="axes"><rect x="%.1f" y="%.1f" width="%.1f" height="%.1f"/></clipPath></defs>'
+            % (_axes_left, _axes_top, _axes_size, _axes_size),
+        '<rect width="100%" height="100%" fill="white"/>',
+        '<g clip-path="url(#axes)">',
+    ]
+
+    svg.append('<path d="M%.1f %.1f V%.1f M%.1f %.1f H%.1f" stroke="#999999" fill="none"/>'
+        % (x(0), _axes_top, _axes_top + _axes_size, _axes_left, y(0), _axes_left + _axes_size))
+
+    for ring in scene['rings']:
+        svg.append('<circle cx="%.1f" cy="%.1f" r="%.1f" stroke="#999999" stroke-dasharray="5,2" fill="none"/>'
+            % (x(0), y(0), ring['radius'] * scale))
+        if ring['label'] is not None:
+            svg.append('<text x="%.1f" y="%.1f" font-size="12" fill="#999999" dominant-baseline="hanging">%s</text>'
+                % (x(ring['radius'] + 0.5), y(-0.5), escape(ring['label'])))
+
+    circles = scene['circles']
+    for cu, cv, cr, color in zip(circles['u'], circles['v'], circles['r'], circles['color']):
+        if None not in (cu, cv, cr):
+            svg.append('<circle cx="%.1f" cy="%.1f" r="%.1f" fill="%s" stroke="%s" opacity="0.05"/>'
+                % (x(cu), y(cv), cr * scale, color, color))
+
+    for seg in scene['segments']:
+        dashes = ' stroke-dasharray="7.7,3.3"' if seg['style'] == 'dashed' else ''
+        svg.append('<path d="%s" stroke="%s" stroke-width="2" fill="none"%s/>' % (path(seg['u'], seg['v']), seg['color'], dashes))
+
+    markers = scene['markers']
+    for mu, mv, label in zip(markers['u'], markers['v'], markers['label']):
+        svg.append('<circle cx="%.1f" cy="%.1f" r="7" fill="black"/>' % (x(mu), y(mv)))
+        svg.append('<text x="%.1f" y="%.1f" font-size="9" font-weight="bold" fill="white" text-anchor="middle" '
+                   'dominant-baseline="central">%s</text>' % (x(mu), y(mv), label))
+
+    for line in scene['lines']:
+        svg.append('<path d="%s" stroke="%s" stroke-width="1" fill="none"/>' % (path(line['u'], line['v']), line['color']))
+
+    for vec in scene['vectors']:
+        vx, vy = x(vec['u']), y(vec['v'])
+        color = '#a04000' if vec['name'] == 'MEAN' else 'black'
+        if vec['name'] == 'MEAN':
+            svg.append('<rect x="%.1f" y="%.1f" width="7" height="7" stroke="%s" fill="none"/>' % (vx - 3.5, vy - 3.5, color))
+        elif vec['name'] == 'SM':
+            svg.append('<path d="M%.1f %.1f h8 M%.1f %.1f v8" stroke="%s"/>' % (vx - 4, vy, vx, vy - 4, color))
+        else:
+            svg.append('<circle cx="%.1f" cy="%.1f" r="3.5" stroke="%s" fill="none"/>' % (vx, vy, color))
+        svg.append('<text x="%.1f" y="%.1f" font-size="14" fill="%s" dominant-baseline="hanging">%s</text>'
+            % (vx + 0.5 * scale, vy + 0.5 * scale, color, vec['name']))
+
+    svg.append('</g>')
+    svg.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" stroke="black" fill="none"/>'
+        % (_axes_left, _axes_top, _axes_size, _axes_size))
+
+    svg.append('<text x="%.1f" y="%.1f" font-size="16" text-anchor="middle">%s</text>'
+        % (_axes_left + _axes_size / 2, _axes_top - 8, escape(scene['title'])))
+
+    table_x = _axes_left + _axes_size * 1.02
+    row_y = _axes_top + 20
+    svg.append('<text x="%.1f" y="%.1f" font-size="14" font-weight="bold">Parameter Table</text>' % (table_x + 60, row_y))
+    for row in scene['table']:
+        row_y += 20
+        col_xs = [ 0, 64, 150 ] if len(row) == 3 else [ 0, 175 ]
+        for col_x, cell in zip(col_xs, row):
+            weight = ' font-weight="bold"' if col_x == 0 or row[0] == "" else ''
+            svg.append('<text x="%.1f" y="%.1f" font-size="14"%s>%s</text>' % (table_x + col_x, row_y, weight, escape(cell)))
+
+    svg.append('</svg>')
+    return "\n".join(svg) + "\n"
+
+
+def is_scene_file(fname):
+    return fname is not None and os.path.splitext(fname)[-1].lower() in _scene_exts
+
+
+def write_hodograph(data, parameters, fname, fixed=False):
+    scene = hodograph_scene(data, parameters, fixed=fixed)
+
+    if os.path.splitext(fname)[-1].lower() == '.svg':
+        output = scene_to_svg(scene)
+    else:
+        output = json.dumps(scene, separators=(',', ':'))
+
+    with open(fname, 'w') as fscene:
+        fscene.write(output)
+
+    return scene['bounds']
@@ -19,26 +19,103 @@ def interp(u, v, altitude, hght):
     return u_hght, v_hght
 
 
-def _clip_profile(prof, alt, clip_alt, intrp_prof):
-    try:
-        idx_clip = np.where((alt[:-1] <= clip_alt) & (alt[1:] > clip_alt))[0][0]
-    except IndexError:
-        return np.nan * np.ones(prof.size)
+class Profile(object):
+    def __init__(self, data):
+        self._data = data
+        self.rid = getattr(data, 'rid', None)
+
+        self.wind_dir = np.asarray(data['wind_dir'])
+        self.wind_spd = np.asarray(data['wind_spd'])
+        self.altitude = np.asarray(data['altitude'])
+        self.u, self.v = vec2comp(self.wind_dir, self.wind_spd)
+
+        self._weights = {}
+        self._clip_idxs = {}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __len__(self):
+        return len(self.altitude)
+
+    def interp(self, prof, hght):
+        idx_lo, frac, in_range = self._interp_weights(hght)
+        if len(self.altitude) == 1:
+            prof_hght = prof[idx_lo]
+        else:
+            prof_hght = prof[idx_lo] + frac * (prof[idx_lo + 1] - prof[idx_lo])
+        return np.where(in_range, prof_hght, np.nan)[()]
+
+    def interp_wind(self, hght):
+        return self.interp(self.u, hght), self.interp(self.v, hght)
+
+    def clip(self, prof, hght, intrp_prof):
+        idx_clip = self._clip_index(hght)
+        if idx_clip is None:
+            return np.nan * np.ones(prof.size)
+
+        return np.append(prof[:(idx_clip + 1)], intrp_prof)
+
+    def _interp_weights(self, hght):
+        # Same as np.interp(hght, altitude, ..., left=np.nan, right=np.nan), but the search only has to be done once 
+        #   per set of heights.
+        key = tuple(np.ravel(hght))
+        try:
+            return self._weights[key]
+        except KeyError:
+            pass
+
+        alt = self.altitude
+        hght = np.asarray(hght, dtype=float)
+        if len(alt) == 0:
+            raise ValueError("Can't interpolate an empty profile.")
+
+        if len(alt) == 1:
+            idx_lo = np.zeros(hght.shape, dtype=int)
+            frac = np.zeros(hght.shape)
+            in_range = (hght == alt[0])
+        else:
+            idx_lo = np.clip(np.searchsorted(alt, hght, side='right') - 1, 0, len(alt) - 2)
+            dalt = alt[idx_lo + 1] - alt[idx_lo]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                frac = np.where(dalt > 0, (hght - alt[idx_lo]) / dalt, 0.)
+            in_range = (hght >= alt[0]) & (hght <= alt[-1])
+
+        weights = self._weights[key] = (idx_lo, frac, in_range)
+        return weights
+
+    def _clip_index(self, hght):
+        try:
+            return self._clip_idxs[hght]
+        except KeyError:
+            pass
+
+        alt = self.altitude
+        try:
+            idx_clip = np.where((alt[:-1] <= hght) & (alt[1:] > hght))[0][0]
+        except IndexError:
+            idx_clip = None
+
+        self._clip_idxs[hght] = idx_clip
+        return idx_clip
 
-    prof_clip = prof[:(idx_clip + 1)]
-    prof_clip = np.append(prof_clip, intrp_prof)
 
-    return np.array(prof_clip)
+def as_profile(data):
+    if isinstance(data, Profile):
+        return data
+    return Profile(data)
 
 
 def compute_shear_mag(data, hght):
-    u, v = vec2comp(data['wind_dir'], data['wind_spd'])
-    u_hght, v_hght = interp(u, v, data['altitude'], hght)
+    prof = as_profile(data)
+    u, v = prof.u, prof.v
+    u_hght, v_hght = prof.interp_wind(hght)
     return np.hypot(u_hght - u[0], v_hght - v[0])
 
 
 def compute_srh(data, storm_motion, hght):
-    u, v = vec2comp(data['wind_dir'], data['wind_spd'])
+    prof = as_profile(data)
+    u, v = prof.u, prof.v
     if len(u) < 2 and len(v) < 2:
         return np.nan
 
@@ -47,9 +124,10 @@ def compute_srh(data, storm_motion, hght):
     sru = (u - storm_u) / 1.94
     srv = (v - storm_v) / 1.94
 
-    sru_hght, srv_hght = interp(sru, srv, data['altitude'], hght)
-    sru_clip = _clip_profile(sru, data['altitude'], hght, sru_hght)
-    srv_clip = _clip_profile(srv, data['altitude'], hght, srv_hght)
+    sru_hght = prof.interp(sru, hght)
+    srv_hght = prof.interp(srv, hght)
+    sru_clip = prof.clip(sru, hght, sru_hght)
+    srv_clip = prof.clip(srv, hght, srv_hght)
 
     layers = (sru_clip[1:] * srv_clip[:-1]) - (sru_clip[:-1] * srv_clip[1:])
     return layers.sum()
@@ -60,10 +138,11 @@ def compute_bunkers(data):
     hght = 6
                 
     # SFC-6km Mean Wind
-    u, v = vec2comp(data['wind_dir'], data['wind_spd'])
-    u_hght, v_hght = interp(u, v, data['altitude'], hght)
-    u_clip = _clip_profile(u, data['altitude'], hght, u_hght)
-    v_clip = _clip_profile(v, data['altitude'], hght, v_hght)
+    prof = as_profile(data)
+    u, v = prof.u, prof.v
+    u_hght, v_hght = prof.interp_wind(hght)
+    u_clip = prof.clip(u, hght, u_hght)
+    v_clip = prof.clip(v, hght, v_hght)
 
     mnu6 = u_clip.mean()
     mnv6 = v_clip.mean()
@@ -83,10 +162,11 @@ def compute_bunkers(data):
     
 
 def compute_crit_angl(data, storm_motion):
-    u, v = vec2comp(data['wind_dir'], data['wind_spd'])
+    prof = as_profile(data)
+    u, v = prof.u, prof.v
     storm_u, storm_v = vec2comp(*storm_motion)
 
-    u_05km, v_05km = interp(u, v, data['altitude'], 0.5)
+    u_05km, v_05km = prof.interp_wind(0.5)
 
     base_u = storm_u - u[0]
     base_v = storm_v - v[0]
@@ -102,6 +182,7 @@ def compute_crit_angl(data, storm_motion):
 
 
 def compute_parameters(data, storm_motion):
+    data = as_profile(data)
     params = {}
 
     try:
@@ -136,4 +217,182 @@ def compute_parameters(data, storm_motion):
 
     return params
 
+def nullify(val):
+    # Parameters as something that can go in JSON, with NaN (or no value at all) as null.
+    val = np.asarray(val, dtype=float)
+    if val.ndim == 0:
+        return None if np.isnan(val) else float(val)
+    return [ nullify(v) for v in val ]
+
+
+
+
+def stack_profiles(profiles):
+    num_levels = max([ len(prof['altitude']) for prof in profiles ] + [ 0 ])
+
+    wind_dir = np.nan * np.ones((len(profiles), num_levels))
+    wind_spd = np.nan * np.ones((len(profiles), num_levels))
+    altitude = np.nan * np.ones((len(profiles), num_levels))
+    mask = np.zeros((len(profiles), num_levels), dtype=bool)
+
+    for idx, prof in enumerate(profiles):
+        num_prof = len(prof['altitude'])
+        wind_dir[idx, :num_prof] = prof['wind_dir']
+        wind_spd[idx, :num_prof] = prof['wind_spd']
+        altitude[idx, :num_prof] = prof['altitude']
+        mask[idx, :num_prof] = True
+
+    return wind_dir, wind_spd, altitude, mask
+
+
+def _interp_batch(prof, alt, num_valid, hght):
+    # Same as np.interp(hght, alt, prof, left=np.nan, right=np.nan) on each row, where the first num_valid levels 
+    #   in each row are valid and sorted by altitude.
+    rows = np.arange(alt.shape[0])
+    if alt.shape[1] == 0:
+        return np.nan * np.ones(alt.shape[0])
+
+    num_below = (alt <= hght).sum(axis=1)
+    idx_lo = np.clip(num_below - 1, 0, np.maximum(num_valid - 2, 0))
+    idx_hi = np.minimum(idx_lo + 1, alt.shape[1] - 1)
+
+    alt_lo = alt[rows, idx_lo]
+    alt_hi = alt[rows, idx_hi]
+    prof_lo = prof[rows, idx_lo]
+    prof_hi = prof[rows, idx_hi]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(alt_hi > alt_lo, (hght - alt_lo) / (alt_hi - alt_lo), 0.)
+        prof_hght = prof_lo + frac * (prof_hi - prof_lo)
+
+    alt_top = alt[rows, np.maximum(num_valid - 1, 0)]
+    in_range = (num_valid > 0) & (hght >= alt[:, 0]) & (hght <= alt_top)
+    return np.where(in_range, prof_hght, np.nan)
+
+
+def _layer_batch(alt, num_valid, hght):
+    # Number of levels in each row below the clip altitude, and whether the clip altitude is inside the profile (the
+    #   batched equivalent of _clip_profile).
+    num_below = (alt <= hght).sum(axis=1)
+    return num_below, (num_below >= 1) & (num_below <= num_valid - 1)
+
+
+def _layer_mean_batch(prof, alt, num_valid, hght, prof_hght):
+    num_below, in_layer = _layer_batch(alt, num_valid, hght)
+    levels = np.arange(alt.shape[1])[np.newaxis, :]
+
+    prof_sum = np.where(levels < num_below[:, np.newaxis], prof, 0.).sum(axis=1)
+    return np.where(in_layer, (prof_sum + prof_hght) / (num_below + 1), np.nan)
+
+
+def _srh_batch(sru, srv, alt, num_valid, hght):
+    rows = np.arange(alt.shape[0])
+    sru_hght = _interp_batch(sru, alt, num_valid, hght)
+    srv_hght = _interp_batch(srv, alt, num_valid, hght)
+
+    num_below, in_layer = _layer_batch(alt, num_valid, hght)
+    levels = np.arange(alt.shape[1] - 1)[np.newaxis, :]
+
+    layers = (sru[:, 1:] * srv[:, :-1]) - (sru[:, :-1] * srv[:, 1:])
+    layer_sum = np.where(levels < (num_below - 1)[:, np.newaxis], layers, 0.).sum(axis=1)
+
+    idx_top = np.maximum(num_below - 1, 0)
+    layer_top = (sru_hght * srv[rows, idx_top]) - (sru[rows, idx_top] * srv_hght)
+    return np.where(in_layer, layer_sum + layer_top, np.nan)
+
+
+def _sort_batch(wind_dir, wind_spd, altitude, mask):
+    if mask is None:
+        mask = np.isfinite(wind_dir) & np.isfinite(wind_spd) & np.isfinite(altitude)
 
+    # Move the valid levels to the front of each row, sorted by altitude, and pad with NaN above.
+    order = np.argsort(np.where(mask, altitude, np.inf), axis=1, kind='stable')
+    mask = np.take_along_axis(mask, order, axis=1)
+    alt = np.where(mask, np.take_along_axis(altitude, order, axis=1), np.inf)
+    u, v = vec2comp(np.take_along_axis(wind_dir, order, axis=1), np.take_along_axis(wind_spd, order, axis=1))
+    u = np.where(mask, u, np.nan)
+    v = np.where(mask, v, np.nan)
+    num_valid = mask.sum(axis=1)
+    return u, v, alt, num_valid
+
+
+def regrid_batch(wind_dir, wind_spd, altitude, hghts, mask=None):
+    wind_dir = np.atleast_2d(np.asarray(wind_dir, dtype=float))
+    wind_spd = np.atleast_2d(np.asarray(wind_spd, dtype=float))
+    altitude = np.atleast_2d(np.asarray(altitude, dtype=float))
+
+    u, v, alt, num_valid = _sort_batch(wind_dir, wind_spd, altitude, mask)
+
+    # Interpolate the components rather than the direction, so winds near north don't average out to south. Each
+    #   height is done for every profile at once. Outside a profile, the winds are NaN.
+    u_grid = np.array([ _interp_batch(u, alt, num_valid, hght) for hght in hghts ]).reshape(len(hghts), -1).T
+    v_grid = np.array([ _interp_batch(v, alt, num_valid, hght) for hght in hghts ]).reshape(len(hghts), -1).T
+    return u_grid, v_grid
+
+
+def compute_parameters_batch(wind_dir, wind_spd, altitude, mask=None, storm_motion='right-mover'):
+    wind_dir = np.atleast_2d(np.asarray(wind_dir, dtype=float))
+    wind_spd = np.atleast_2d(np.asarray(wind_spd, dtype=float))
+    altitude = np.atleast_2d(np.asarray(altitude, dtype=float))
+
+    u, v, alt, num_valid = _sort_batch(wind_dir, wind_spd, altitude, mask)
+
+    u_sfc = u[:, 0] if u.shape[1] > 0 else np.nan * np.ones(u.shape[0])
+    v_sfc = v[:, 0] if v.shape[1] > 0 else np.nan * np.ones(v.shape[0])
+
+    params = {}
+
+    # Bunkers storm motions and the SFC-6km mean wind
+    d = 7.5 * 1.94
+    u_6km = _interp_batch(u, alt, num_valid, 6)
+    v_6km = _interp_batch(v, alt, num_valid, 6)
+    mnu6 = _layer_mean_batch(u, alt, num_valid, 6, u_6km)
+    mnv6 = _layer_mean_batch(v, alt, num_valid, 6, v_6km)
+
+    shru = u_6km - u_sfc
+    shrv = v_6km - v_sfc
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tmp = d / np.hypot(shru, shrv)
+
+    params['bunkers_right'] = comp2vec(mnu6 + (tmp * shrv), mnv6 - (tmp * shru))
+    params['bunkers_left'] = comp2vec(mnu6 - (tmp * shrv), mnv6 + (tmp * shru))
+    params['mean_wind'] = comp2vec(mnu6, mnv6)
+
+    if storm_motion.lower() in ['blm', 'left-mover']:
+        params['storm_motion'] = params['bunkers_left']
+    elif storm_motion.lower() in ['brm', 'right-mover']:
+        params['storm_motion'] = params['bunkers_right']
+    elif storm_motion.lower() in ['mnw', 'mean-wind']:
+        params['storm_motion'] = params['mean_wind']
+    else:
+        storm_dir, storm_spd = tuple(int(v) for v in storm_motion.split('/'))
+        params['storm_motion'] = (storm_dir * np.ones(u.shape[0]), storm_spd * np.ones(u.shape[0]))
+
+    storm_u, storm_v = vec2comp(*params['storm_motion'])
+
+    # Critical angle
+    u_05km = _interp_batch(u, alt, num_valid, 0.5)
+    v_05km = _interp_batch(v, alt, num_valid, 0.5)
+
+    base_u = storm_u - u_sfc
+    base_v = storm_v - v_sfc
+    ang_u = u_05km - u_sfc
+    ang_v = v_05km - v_sfc
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        base_dot_ang = base_u * ang_u + base_v * ang_v
+        params['critical'] = np.degrees(np.arccos(base_dot_ang / (np.hypot(base_u, base_v) * np.hypot(ang_u, ang_v))))
+
+    # Bulk shear
+    for hght in [1, 3, 6]:
+        u_hght = _interp_batch(u, alt, num_valid, hght)
+        v_hght = _interp_batch(v, alt, num_valid, hght)
+        params["shear_mag_%dm" % (hght * 1000)] = np.hypot(u_hght - u_sfc, v_hght - v_sfc)
+
+    # Storm-relative helicity
+    sru = (u - storm_u[:, np.newaxis]) / 1.94
+    srv = (v - storm_v[:, np.newaxis]) / 1.94
+    for hght in [1, 3]:
+        params["srh_%dm" % (hght * 1000)] = _srh_batch(sru, srv, alt, num_valid, hght)
+
+    return params
@@ -8,14 +8,20 @@ mpl.use('agg')
 import pylab
 from matplotlib.patches import Circle
 from matplotlib.lines import Line2D
+from matplotlib.text import Text
+from matplotlib.collections import PatchCollection, LineCollection
 
+import os
 import json
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
-from params import vec2comp
+from params import as_profile
+from hodo_scene import frame_bounds, range_rings, hodo_layers
 
-_seg_hghts = [0, 3, 6, 9, 12, 18]
-_seg_colors = ['r', '#00ff00', '#008800', '#993399', 'c']
+# Rendered backgrounds, keyed by the frame bounds and dpi. These are about 7 MB apiece at the default size.
+_background_cache = OrderedDict()
+_background_cache_size = 8
 
 def _total_seconds(td):
     return td.days * 24 * 3600 + td.seconds + td.microseconds * 1e-6
@@ -135,177 +141,194 @@ def _plot_param_table(parameters, web=False):
 
 
 def _plot_data(data, parameters):
-    storm_dir, storm_spd = parameters['storm_motion']
-    bl_dir, bl_spd = parameters['bunkers_left']
-    br_dir, br_spd = parameters['bunkers_right']
-    mn_dir, mn_spd = parameters['mean_wind']
+    layers = hodo_layers(data, parameters)
+
+    # Draw the RMS circles and segments as collections; hundreds of separate artists are slow to render. The dashed
+    #   segment to the surface wind is always at the bottom of the profile, so it goes first.
+    circ_u, circ_v, circ_rads, circ_colors = layers['circles']
+    circs = [ Circle((upt, vpt), rad) for upt, vpt, rad in zip(circ_u, circ_v, circ_rads) ]
+    pylab.gca().add_collection(PatchCollection(circs, facecolors=circ_colors, edgecolors=circ_colors, alpha=0.05),
+                               autolim=False)
+
+    dashed_segs, dashed_colors = layers['dashed']
+    pylab.gca().add_collection(LineCollection(dashed_segs, colors=dashed_colors, linewidths=1.5, linestyles='--',
+                                              capstyle='butt', joinstyle='round'), autolim=False)
+    solid_segs, solid_colors = layers['solid']
+    pylab.gca().add_collection(LineCollection(solid_segs, colors=solid_colors, linewidths=1.5, linestyles='-',
+                                              capstyle='projecting', joinstyle='round'), autolim=False)
+
+    mkr_u, mkr_v, mkr_z = layers['markers']
+    pylab.plot(mkr_u, mkr_v, 'ko', ms=10)
+    for um, vm, zm in zip(mkr_u, mkr_v, mkr_z):
+        if not np.isnan(um):
+            pylab.text(um, vm - 0.1, str(zm), va='center', ha='center', color='white', size=6.5, fontweight='bold')
 
-    u, v = vec2comp(data['wind_dir'], data['wind_spd'])
-    alt = data['altitude']
+    if layers['storm_line'] is not None:
+        pylab.plot(*layers['storm_line'], color='c', linestyle='-', linewidth=0.75)
+        pylab.plot(*layers['critical_line'], color='m', linestyle='-', linewidth=0.75)
+
+    for name, vec_u, vec_v in layers['vectors']:
+        if name == 'MEAN':
+            pylab.plot(vec_u, vec_v, 's', color='#a04000', markersize=5, mfc='none')
+            pylab.text(vec_u + 0.6, vec_v - 0.6, name, ha='left', va='top', color='#a04000', fontsize=10)
+        elif name == 'SM':
+            pylab.plot(vec_u, vec_v, 'k+', markersize=6)
+            pylab.text(vec_u + 0.5, vec_v - 0.5, name, ha='left', va='top', color='k', fontsize=10)
+        else:
+            pylab.plot(vec_u, vec_v, 'ko', markersize=5, mfc='none')
+            pylab.text(vec_u + 0.5, vec_v - 0.5, name, ha='left', va='top', color='k', fontsize=10)
 
-    storm_u, storm_v = vec2comp(storm_dir, storm_spd)
-    bl_u, bl_v = vec2comp(bl_dir, bl_spd)
-    br_u, br_v = vec2comp(br_dir, br_spd)
-    mn_u, mn_v = vec2comp(mn_dir, mn_spd)
 
-    seg_idxs = np.searchsorted(alt, _seg_hghts)
-    try:
-        seg_u = np.interp(_seg_hghts, alt, u, left=np.nan, right=np.nan)
-        seg_v = np.interp(_seg_hghts, alt, v, left=np.nan, right=np.nan)
-        ca_u = np.interp(0.5, alt, u, left=np.nan, right=np.nan)
-        ca_v = np.interp(0.5, alt, v, left=np.nan, right=np.nan)
-    except ValueError:
-        seg_u = np.nan * np.array(_seg_hghts)
-        seg_v = np.nan * np.array(_seg_hghts)
-        ca_u = np.nan
-        ca_v = np.nan
-
-    mkr_z = np.arange(16)
-    try:
-        mkr_u = np.interp(mkr_z, alt, u, left=np.nan, right=np.nan)
-        mkr_v = np.interp(mkr_z, alt, v, left=np.nan, right=np.nan)
-    except ValueError:
-        mkr_u = np.nan * mkr_z
-        mkr_v = np.nan * mkr_z
-
-    for idx in range(len(_seg_hghts) - 1):
-        idx_start = seg_idxs[idx]
-        idx_end = seg_idxs[idx + 1]
-
-        if not np.isnan(seg_u[idx]):
-            pylab.plot([seg_u[idx], u[idx_start]], [seg_v[idx], v[idx_start]], '-', color=_seg_colors[idx], linewidth=1.5)
-
-        if idx_start < len(data['rms_error']) and data['rms_error'][idx_start] == 0.:
-            # The first segment is to the surface wind, draw it in a dashed line
-            pylab.plot(u[idx_start:(idx_start + 2)], v[idx_start:(idx_start + 2)], '--', color=_seg_colors[idx], linewidth=1.5)
-            pylab.plot(u[(idx_start + 1):idx_end], v[(idx_start + 1):idx_end], '-', color=_seg_colors[idx], linewidth=1.5)
-        else:
-            pylab.plot(u[idx_start:idx_end], v[idx_start:idx_end], '-', color=_seg_colors[idx], linewidth=1.5)
+def _plot_background(min_u, max_u, min_v, max_v):
+    pylab.axvline(x=0, linestyle='-', color='#999999')
+    pylab.axhline(y=0, linestyle='-', color='#999999')
 
-        if not np.isnan(seg_u[idx + 1]):
-            pylab.plot([u[idx_end - 1], seg_u[idx + 1]], [v[idx_end - 1], seg_v[idx + 1]], '-', color=_seg_colors[idx], linewidth=1.5)
+    for irng, rng_str in range_rings(min_u, max_u, min_v, max_v):
+        ring = Circle((0., 0.), irng, linestyle='dashed', fc='none', ec='#999999')
+        pylab.gca().add_patch(ring)
 
-        for upt, vpt, rms in list(zip(u, v, data['rms_error']))[idx_start:idx_end]:
-            rad = np.sqrt(2) * rms
-            circ = Circle((upt, vpt), rad, color=_seg_colors[idx], alpha=0.05)
-            pylab.gca().add_patch(circ)
+        if rng_str is not None:
+            pylab.text(irng + 0.5, -0.5, rng_str, ha='left', va='top', fontsize=9, color='#999999', clip_on=True, clip_box=pylab.gca().get_clip_box())
 
-    pylab.plot(mkr_u, mkr_v, 'ko', ms=10)
-    for um, vm, zm in zip(mkr_u, mkr_v, mkr_z):
-        if not np.isnan(um):
-            pylab.text(um, vm - 0.1, str(zm), va='center', ha='center', color='white', size=6.5, fontweight='bold')
 
-    try:
-        pylab.plot([storm_u, u[0]], [storm_v, v[0]], 'c-', linewidth=0.75)
-        pylab.plot([u[0], ca_u], [v[0], ca_v], 'm-', linewidth=0.75)
-    except IndexError:
-        pass
+class HodographPlot(object):
+    def __init__(self):
+        self._fig = pylab.figure(figsize=(10, 7.5), dpi=150)
+        fig_wid, fig_hght = self._fig.get_size_inches()
+        fig_aspect = fig_wid / fig_hght
 
-    if not (np.isnan(bl_u) or np.isnan(bl_v)):
-        pylab.plot(bl_u, bl_v, 'ko', markersize=5, mfc='none')
-        pylab.text(bl_u + 0.5, bl_v - 0.5, "LM", ha='left', va='top', color='k', fontsize=10)
+        axes_left = 0.05
+        axes_bot = 0.05
+        axes_hght = 0.9
+        axes_wid = axes_hght / fig_aspect
+        self._axes = pylab.axes((axes_left, axes_bot, axes_wid, axes_hght))
 
-    if not (np.isnan(br_u) or np.isnan(br_v)):
-        pylab.plot(br_u, br_v, 'ko', markersize=5, mfc='none')
-        pylab.text(br_u + 0.5, br_v - 0.5, "RM", ha='left', va='top', color='k', fontsize=10)
+        self._bg_bounds = None
+        self._bg_artists = []
+        self._data_artists = []
 
-    if not (np.isnan(mn_u) or np.isnan(mn_v)):
-        pylab.plot(mn_u, mn_v, 's', color='#a04000', markersize=5, mfc='none')
-        pylab.text(mn_u + 0.6, mn_v - 0.6, "MEAN", ha='left', va='top', color='#a04000', fontsize=10)
+    def render(self, data, parameters, fname=None, web=False, fixed=False, archive=False, bounds=None):
+        data = as_profile(data)
+        img_title = "%s VWP valid %s" % (data.rid, data['time'].strftime("%d %b %Y %H%M UTC"))
+        if fname is not None:
+            img_file_name = fname
+        else:
+            img_file_name = "%s_vad.png" % data.rid
 
-    smv_is_brm = (storm_u == br_u and storm_v == br_v)
-    smv_is_blm = (storm_u == bl_u and storm_v == bl_v)
-    smv_is_mnw = (storm_u == mn_u and storm_v == mn_v)
+        sat_age = 6 * 3600
+        if bounds is None:
+            bounds = frame_bounds(data, fixed=fixed)
+        min_u, max_u, min_v, max_v = bounds
 
-    if not (np.isnan(storm_u) or np.isnan(storm_v)) and not (smv_is_brm or smv_is_blm or smv_is_mnw):
-        pylab.plot(storm_u, storm_v, 'k+', markersize=6)
-        pylab.text(storm_u + 0.5, storm_v - 0.5, "SM", ha='left', va='top', color='k', fontsize=10)
+        now = datetime.utcnow()
+        img_age = now - data['time']
+        age_cstop = min(_total_seconds(img_age) / sat_age, 1) * 0.4
+        age_color = mpl.cm.get_cmap('hot')(age_cstop)[:-1]
 
+        age_str = "Image created on %s (%s old)" % (now.strftime("%d %b %Y %H%M UTC"), _fmt_timedelta(img_age))
 
-def _plot_background(min_u, max_u, min_v, max_v):
-    max_ring = int(np.ceil(max(
-        np.hypot(min_u, min_v),
-        np.hypot(min_u, max_v),
-        np.hypot(max_u, min_v),
-        np.hypot(max_u, max_v)
-    )))
+        pylab.figure(self._fig.number)
+        pylab.sca(self._axes)
 
-    pylab.axvline(x=0, linestyle='-', color='#999999')
-    pylab.axhline(y=0, linestyle='-', color='#999999')
+        # The data are always drawn after the background, so the stacking order is the same as for a new figure.
+        self._remove(self._data_artists)
 
-    for irng in range(10, max_ring, 10):
-        ring = Circle((0., 0.), irng, linestyle='dashed', fc='none', ec='#999999')
-        pylab.gca().add_patch(ring)
+        if self._bg_bounds != (min_u, max_u, min_v, max_v):
+            self._remove(self._bg_artists)
+            self._bg_artists = self._collect(_plot_background, min_u, max_u, min_v, max_v)
+            self._bg_bounds = (min_u, max_u, min_v, max_v)
 
-        if irng <= max_u - 10:
-            rng_str = "%d kts" % irng if max_u - 20 < irng <= max_u - 10 else "%d" % irng
+        self._data_artists = self._collect(self._plot_layers, data, parameters, img_title, age_str, age_color,
+                                           web, archive)
 
-            pylab.text(irng + 0.5, -0.5, rng_str, ha='left', va='top', fontsize=9, color='#999999', clip_on=True, clip_box=pylab.gca().get_clip_box())
+        pylab.xlim(min_u, max_u)
+        pylab.ylim(min_v, max_v)
+        pylab.xticks([])
+        pylab.yticks([])
 
+        if os.path.splitext(img_file_name)[-1].lower() == '.png':
+            self._blit(img_file_name)
+        else:
+            pylab.savefig(img_file_name, dpi=self._fig.dpi)
 
-def plot_hodograph(data, parameters, fname=None, web=False, fixed=False, archive=False):
-    img_title = "%s VWP valid %s" % (data.rid, data['time'].strftime("%d %b %Y %H%M UTC"))
-    if fname is not None:
-        img_file_name = fname
-    else:
-        img_file_name = "%s_vad.png" % data.rid
+        return {'min_u':min_u, 'max_u':max_u, 'min_v':min_v, 'max_v':max_v}
 
-    u, v = vec2comp(data['wind_dir'], data['wind_spd'])
+    def close(self):
+        pylab.close(self._fig)
 
-    sat_age = 6 * 3600
-    if fixed or len(u) == 0:
-        ctr_u, ctr_v = 20, 20
-        size = 120
-    else:
-        ctr_u = u.mean()
-        ctr_v = v.mean()
-        size = max(u.max() - u.min(), v.max() - v.min()) + 20
-        size = max(120, size)
-
-    min_u = ctr_u - size / 2
-    max_u = ctr_u + size / 2
-    min_v = ctr_v - size / 2
-    max_v = ctr_v + size / 2
-
-    now = datetime.utcnow()
-    img_age = now - data['time']
-    age_cstop = min(_total_seconds(img_age) / sat_age, 1) * 0.4
-    age_color = mpl.cm.get_cmap('hot')(age_cstop)[:-1]
-
-    age_str = "Image created on %s (%s old)" % (now.strftime("%d %b %Y %H%M UTC"), _fmt_timedelta(img_age))
-
-    pylab.figure(figsize=(10, 7.5), dpi=150)
-    fig_wid, fig_hght = pylab.gcf().get_size_inches()
-    fig_aspect = fig_wid / fig_hght
-
-    axes_left = 0.05
-    axes_bot = 0.05
-    axes_hght = 0.9
-    axes_wid = axes_hght / fig_aspect
-    pylab.axes((axes_left, axes_bot, axes_wid, axes_hght))
-
-    _plot_background(min_u, max_u, min_v, max_v)
-    _plot_data(data, parameters)
-    _plot_param_table(parameters, web=web)
-
-    pylab.xlim(min_u, max_u)
-    pylab.ylim(min_v, max_v)
-    pylab.xticks([])
-    pylab.yticks([])
-
-    if not archive:
-        pylab.title(img_title, color=age_color)
-        pylab.text(0., -0.01, age_str, transform=pylab.gca().transAxes, ha='left', va='top', fontsize=9, color=age_color)
-    else:
-        pylab.title(img_title)
+    def _plot_layers(self, data, parameters, img_title, age_str, age_color, web, archive):
+        _plot_data(data, parameters)
+        _plot_param_table(parameters, web=web)
+
+        if not archive:
+            pylab.title(img_title, color=age_color)
+            pylab.text(0., -0.01, age_str, transform=pylab.gca().transAxes, ha='left', va='top', fontsize=9, color=age_color)
+        else:
+            pylab.title(img_title, color=mpl.rcParams['text.color'])
+
+        if web:
+            web_brand = "http://www.autumnsky.us/vad/"
+            pylab.text(1.0, -0.01, web_brand, transform=pylab.gca().transAxes, ha='right', va='top', fontsize=9)
+
+    def _blit(self, img_file_name):
+        canvas = self._fig.canvas
+
+        # Only the parts of the background that go under all the data (the range rings) can be cached. The rest (the
+        #   axis lines, the ring labels, and the spines) gets drawn along with the data, in the same order as a full
+        #   draw would use. The axes (which have no ticks) and the empty titles don't draw anything, but the title gets
+        #   placed by them, so they stay in the background.
+        data_zorder = min(artist.get_zorder() for artist in self._data_artists)
+        cached = set(artist for artist in self._bg_artists if artist.get_zorder() <= data_zorder)
+        cached.update([ self._axes.xaxis, self._axes.yaxis, self._axes.patch ])
+        layers = [ artist for artist in self._axes.get_children() if artist not in cached and artist.get_visible()
+                   and not (isinstance(artist, Text) and artist.get_text() == '') ]
+
+        bg_key = self._bg_bounds + (self._fig.dpi,)
+        try:
+            background = _background_cache.pop(bg_key)
+        except KeyError:
+            # Hiding (or blanking) the title would throw off its position, so make it see-through instead.
+            title_alpha = self._axes.title.get_alpha()
+            self._axes.title.set_alpha(0)
+            for artist in layers:
+                if artist is not self._axes.title:
+                    artist.set_visible(False)
+
+            canvas.draw()
+
+            self._axes.title.set_alpha(title_alpha)
+            for artist in layers:
+                artist.set_visible(True)
+
+            background = canvas.copy_from_bbox(self._fig.bbox)
+            if len(_background_cache) >= _background_cache_size:
+                _background_cache.popitem(last=False)
+        _background_cache[bg_key] = background
+
+        # Composite the data on top of the background instead of redrawing the whole figure.
+        canvas.restore_region(background)
+        for artist in sorted(layers, key=lambda a: a.get_zorder()):
+            self._fig.draw_artist(artist)
+
+        mpl.image.imsave(img_file_name, np.asarray(canvas.buffer_rgba()), format='png', origin='upper', dpi=self._fig.dpi)
+
+    def _collect(self, plot_func, *args):
+        before = set(self._axes.get_children())
+        plot_func(*args)
+        return [ artist for artist in self._axes.get_children() if artist not in before ]
+
+    def _remove(self, artists):
+        for artist in artists:
+            artist.remove()
+        del artists[:]
 
-    if web:
-        web_brand = "http://www.autumnsky.us/vad/"
-        pylab.text(1.0, -0.01, web_brand, transform=pylab.gca().transAxes, ha='right', va='top', fontsize=9)
 
-    pylab.savefig(img_file_name, dpi=pylab.gcf().dpi)
-    pylab.close()
+def plot_hodograph(data, parameters, fname=None, web=False, fixed=False, archive=False):
+    hodo = HodographPlot()
+    try:
+        bounds = hodo.render(data, parameters, fname=fname, web=web, fixed=fixed, archive=archive)
+    finally:
+        hodo.close()
 
     if web:
-        bounds = {'min_u':min_u, 'max_u':max_u, 'min_v':min_v, 'max_v':max_v}
-        print(json.dumps(bounds)) 
+        print(json.dumps(bounds))
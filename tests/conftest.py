@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository rather than in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def ftp_stub(tmpdir):
+    # pyftpdlib is only needed for the tests, so skip the ones that talk to a server if it isn't there.
+    pytest.importorskip('pyftpdlib')
+    from ftp_stub import FTPStub
+
+    stub = FTPStub(str(tmpdir.join('ftp')))
+    yield stub
+    stub.close()
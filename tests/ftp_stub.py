@@ -0,0 +1,70 @@
+import os
+import time
+import logging
+import threading
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+_vwp_dir = "SL.us008001/DF.of/DC.radar/DS.48vwp"
+
+
+class FTPStub(object):
+    # An FTP server on localhost over a directory laid out like the one on tgftp. It counts the connections it gets
+    #   and the transfers it's asked for, and can be told to drop the connection on the next few transfers or to take
+    #   its time over them.
+    def __init__(self, root):
+        self.root = root
+        self.connections = 0
+        self.transfers = []
+        self.drops = 0
+        self.delay = 0
+        os.makedirs(os.path.join(root, _vwp_dir))
+
+        stub = self
+
+        class Handler(FTPHandler):
+            def on_connect(self):
+                stub.connections += 1
+
+            def pre_process_command(self, line, cmd, arg):
+                if cmd in [ 'RETR', 'LIST' ]:
+                    stub.transfers.append((cmd, arg))
+                    if stub.drops > 0:
+                        stub.drops -= 1
+                        self.close()
+                        return
+                    time.sleep(stub.delay)
+                FTPHandler.pre_process_command(self, line, cmd, arg)
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_anonymous(root)
+        Handler.authorizer = authorizer
+
+        logging.getLogger('pyftpdlib').setLevel(logging.ERROR)
+        self._server = ThreadedFTPServer(('127.0.0.1', 0), Handler)
+        self.port = self._server.socket.getsockname()[1]
+        self.base_url = "ftp://127.0.0.1:%d/%s/" % (self.port, _vwp_dir)
+
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'timeout': 0.1})
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_file(self, radar_id, name, data, mtime=None):
+        radar_dir = os.path.join(self.root, _vwp_dir, "SI.%s" % radar_id.lower())
+        if not os.path.isdir(radar_dir):
+            os.makedirs(radar_dir)
+
+        path = os.path.join(radar_dir, name)
+        with open(path, 'wb') as fvwp:
+            fvwp.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def url(self, radar_id, name=""):
+        return "%sSI.%s/%s" % (self.base_url, radar_id.lower(), name)
+
+    def close(self):
+        self._server.close_all()
+        self._thread.join()
@@ -0,0 +1,66 @@
+from urllib.request import URLError
+
+import pytest
+
+from ftp_pool import FTPPool
+
+
+@pytest.fixture
+def pool():
+    with FTPPool(timeout=5, retries=2, backoff=0) as pool:
+        yield pool
+
+
+def test_fetch(ftp_stub, pool):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+
+    assert pool.fetch(ftp_stub.url('KTLX', 'sn.0001')) == b"vwp"
+    assert 'sn.0001' in pool.listing(ftp_stub.url('KTLX'))
+
+
+def test_reuses_connection(ftp_stub, pool):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+
+    pool.fetch(ftp_stub.url('KTLX', 'sn.0001'))
+    pool.listing(ftp_stub.url('KTLX'))
+    assert ftp_stub.connections == 1
+
+
+def test_dropped_connection_retried(ftp_stub, pool):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+    ftp_stub.drops = 2
+
+    assert pool.fetch(ftp_stub.url('KTLX', 'sn.0001')) == b"vwp"
+    assert len(ftp_stub.transfers) == 3
+    assert ftp_stub.connections == 3
+
+
+def test_dropped_connection_gives_up(ftp_stub, pool):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+    ftp_stub.drops = 3
+
+    with pytest.raises(URLError):
+        pool.fetch(ftp_stub.url('KTLX', 'sn.0001'))
+    assert len(ftp_stub.transfers) == 3
+
+
+def test_missing_file_not_retried(ftp_stub, pool):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+
+    with pytest.raises(URLError) as exc:
+        pool.fetch(ftp_stub.url('KTLX', 'sn.0002'))
+    assert "550" in str(exc.value)
+    assert len(ftp_stub.transfers) == 1
+
+    # The connection's still good, so it goes back in the pool.
+    assert pool.fetch(ftp_stub.url('KTLX', 'sn.0001')) == b"vwp"
+    assert ftp_stub.connections == 1
+
+
+def test_idle_connection_expires(ftp_stub):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+
+    with FTPPool(max_idle=0) as pool:
+        pool.fetch(ftp_stub.url('KTLX', 'sn.0001'))
+        pool.fetch(ftp_stub.url('KTLX', 'sn.0001'))
+    assert ftp_stub.connections == 2
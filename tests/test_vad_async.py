@@ -0,0 +1,103 @@
+import time
+import asyncio
+from datetime import datetime
+from urllib.request import URLError
+
+import pytest
+
+from vad_async import AsyncFTPPool, download_vad
+from vwp_factory import make_vwp
+
+_times = [ datetime(2013, 5, 20, 19, 30), datetime(2013, 5, 20, 19, 35), datetime(2013, 5, 20, 19, 40) ]
+
+
+def _run(coro_func, *args):
+    async def run():
+        async with AsyncFTPPool(timeout=5, retries=2, backoff=0) as pool:
+            return await coro_func(pool, *args)
+    return asyncio.run(run())
+
+
+def test_fetch(ftp_stub):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+
+    async def fetch(pool):
+        return await pool.fetch(ftp_stub.url('KTLX', 'sn.0001')), await pool.listing(ftp_stub.url('KTLX'))
+
+    data, listing = _run(fetch)
+    assert data == b"vwp"
+    assert 'sn.0001' in listing
+
+
+def test_requests_shared(ftp_stub):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+    ftp_stub.delay = 0.2
+
+    async def fetch(pool):
+        return await asyncio.gather(*[ pool.fetch(ftp_stub.url('KTLX', 'sn.0001')) for idx in range(10) ])
+
+    assert _run(fetch) == [ b"vwp" ] * 10
+    assert len(ftp_stub.transfers) == 1
+
+
+def test_cancel_shielded(ftp_stub):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+    ftp_stub.delay = 0.3
+
+    async def fetch(pool):
+        url = ftp_stub.url('KTLX', 'sn.0001')
+        first = asyncio.ensure_future(pool.fetch(url))
+        second = asyncio.ensure_future(pool.fetch(url))
+        await asyncio.sleep(0.1)
+
+        # The first caller gives up, but the transfer goes on for the second.
+        first.cancel()
+        data = await second
+        return first.cancelled(), data
+
+    assert _run(fetch) == (True, b"vwp")
+    assert len(ftp_stub.transfers) == 1
+
+
+def test_dropped_connection_retried(ftp_stub):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+    ftp_stub.drops = 2
+
+    async def fetch(pool):
+        return await pool.fetch(ftp_stub.url('KTLX', 'sn.0001'))
+
+    assert _run(fetch) == b"vwp"
+    assert len(ftp_stub.transfers) == 3
+    assert ftp_stub.connections == 3
+
+
+def test_missing_file_not_retried(ftp_stub):
+    ftp_stub.add_file('KTLX', 'sn.0001', b"vwp")
+
+    async def fetch(pool):
+        with pytest.raises(URLError):
+            await pool.fetch(ftp_stub.url('KTLX', 'sn.0002'))
+        return await pool.fetch(ftp_stub.url('KTLX', 'sn.0001'))
+
+    assert _run(fetch) == b"vwp"
+    assert len(ftp_stub.transfers) == 2
+    assert ftp_stub.connections == 1
+
+
+def test_download_vad_cache(ftp_stub, tmpdir):
+    # Listed a few minutes apart, the way they are on the server, with sn.last the newest.
+    now = time.time()
+    for idx, (name, valid_time) in enumerate(zip([ 'sn.0001', 'sn.0002', 'sn.last' ], _times)):
+        ftp_stub.add_file('KTLX', name, make_vwp(valid_time, seed=idx), mtime=now - (3 - idx) * 300)
+    cache_path = str(tmpdir.join('cache'))
+
+    async def download(pool):
+        return await download_vad('KTLX', cache_path=cache_path, pool=pool, base_url=ftp_stub.base_url)
+
+    assert _run(download)['time'] == _times[-1]
+    assert [ cmd for cmd, arg in ftp_stub.transfers ] == [ 'LIST', 'RETR' ]
+    assert len(tmpdir.join('cache').listdir(lambda path: not path.basename.startswith('.'))) == 1
+
+    # The listing and the file both come out of the cache the second time.
+    assert _run(download)['time'] == _times[-1]
+    assert len(ftp_stub.transfers) == 2
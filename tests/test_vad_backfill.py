@@ -0,0 +1,68 @@
+import io
+import os
+import gzip
+import json
+import tarfile
+from datetime import datetime
+
+from vad_backfill import backfill, walk_dir
+from vwp_factory import make_vwp, file_name
+
+_times = [ datetime(2013, 5, 20, 19, 30), datetime(2013, 5, 20, 19, 35), datetime(2013, 5, 20, 19, 40) ]
+
+
+def _archive_dir(root):
+    os.makedirs(str(root.join('KTLX')))
+
+    with gzip.open(str(root.join('KTLX', '%s.gz' % file_name(_times[0]))), 'wb') as fgz:
+        fgz.write(make_vwp(_times[0]))
+
+    with tarfile.open(str(root.join('KTLX', 'bundle.tar')), 'w') as tar:
+        for seed, valid_time in enumerate(_times[1:]):
+            data = make_vwp(valid_time, seed=seed)
+            info = tarfile.TarInfo(file_name(valid_time))
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return str(root)
+
+
+def test_walk_dir_reads_bundles(tmpdir):
+    source = _archive_dir(tmpdir.join('source'))
+    items = list(walk_dir(source))
+
+    assert [ os.path.basename(name) for name, data in items ] == [ file_name(valid_time) for valid_time in _times ]
+    assert all(data is not None for name, data in items)
+
+
+def test_backfill_directory_of_bundles(tmpdir):
+    source = _archive_dir(tmpdir.join('source'))
+    output = str(tmpdir.join('output'))
+
+    num_items, num_errors = backfill(source, output, workers=1, progress=io.StringIO())
+    assert (num_items, num_errors) == (3, 0)
+
+    with open(os.path.join(output, 'backfill-000000.jsonl')) as fchunk:
+        records = [ json.loads(line) for line in fchunk ]
+    assert [ record['valid_time'] for record in records ] == [ valid_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+                                                              for valid_time in _times ]
+    assert set(record['radar_id'] for record in records) == set([ 'KTLX' ])
+
+
+def test_backfill_truncated_bundle(tmpdir):
+    source = _archive_dir(tmpdir.join('source'))
+    output = str(tmpdir.join('output'))
+
+    # A compressed copy of the bundle, cut off halfway through
+    with open(os.path.join(source, 'KTLX', 'bundle.tar'), 'rb') as ftar:
+        data = gzip.compress(ftar.read())
+    with open(os.path.join(source, 'KTLX', 'cut.tar.gz'), 'wb') as fgz:
+        fgz.write(data[:(len(data) // 2)])
+
+    num_items, num_errors = backfill(source, output, workers=1, progress=io.StringIO())
+    assert num_errors == 1
+
+    with open(os.path.join(output, 'backfill-000000.jsonl')) as fchunk:
+        records = [ json.loads(line) for line in fchunk ]
+    errors = [ record for record in records if 'error' in record ]
+    assert [ record['source'] for record in errors ] == [ os.path.join(source, 'KTLX', 'cut.tar.gz') ]
+    assert len([ record for record in records if 'error' not in record ]) == num_items - 1 >= 3
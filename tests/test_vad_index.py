@@ -0,0 +1,56 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import vad_index
+from vad_index import VADIndex, load_local_vad
+from vwp_factory import make_vwp, file_name
+
+_time = datetime(2013, 5, 20, 19, 30)
+
+
+def _archive(root):
+    root.ensure(dir=True)
+    root.join(file_name(_time)).write_binary(make_vwp(_time))
+    return str(root)
+
+
+def test_index_path(tmpdir):
+    local_path = _archive(tmpdir.join('local'))
+    index_path = str(tmpdir.join('index.sqlite'))
+
+    vad = load_local_vad(local_path, 'KTLX', datetime(2013, 5, 20, 19, 33), index_path=index_path)
+    assert vad['time'] == _time
+    assert os.path.exists(index_path)
+    assert not os.path.exists(os.path.join(local_path, '.vad_index.sqlite'))
+
+
+def test_read_only_root(tmpdir, monkeypatch):
+    local_path = _archive(tmpdir.join('local'))
+    cache_dir = tmpdir.join('cache')
+    monkeypatch.setattr(vad_index, '_cache_dir', str(cache_dir))
+    monkeypatch.setattr(os, 'access', lambda path, mode: False)
+
+    index = VADIndex(local_path)
+    index.update()
+    assert index.find_before('KTLX', datetime(2013, 5, 20, 19, 33)).time == _time
+    index.close()
+
+    assert not os.path.exists(os.path.join(local_path, '.vad_index.sqlite'))
+    assert len(cache_dir.listdir()) == 1
+
+
+def test_miss_doesnt_walk(tmpdir, monkeypatch):
+    local_path = _archive(tmpdir.join('local'))
+    index_path = str(tmpdir.join('index.sqlite'))
+    load_local_vad(local_path, 'KTLX', datetime(2013, 5, 20, 19, 33), index_path=index_path)
+
+    walks = []
+    walk = VADIndex._walk
+    monkeypatch.setattr(VADIndex, '_walk', lambda self: walks.append(self) or walk(self))
+
+    # Before anything in the archive, so it misses, but the index was just brought up to date.
+    with pytest.raises(ValueError):
+        load_local_vad(local_path, 'KTLX', datetime(2013, 5, 20, 19, 0), index_path=index_path)
+    assert len(walks) == 0
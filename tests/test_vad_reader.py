@@ -0,0 +1,59 @@
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from vad_reader import VADFile, read_vad_stream
+from vwp_factory import make_vwp, symbology_layer
+
+_seq = b"\x01\r\r\n001 \r\r\n"
+_trailer = b"\r\r\n\x03"
+
+
+def _overrun_layer():
+    # The layer ends partway through the last wind barb packet.
+    return symbology_layer()[:-6]
+
+
+def _feed(*products):
+    return io.BytesIO(b"".join(_seq + product + _trailer for product in products))
+
+
+def test_from_buffer():
+    vad = VADFile.from_buffer(make_vwp(datetime(2013, 5, 20, 19, 30), num_levels=20))
+    assert vad['time'] == datetime(2013, 5, 20, 19, 30)
+    assert len(vad['wind_dir']) == 20
+    assert np.all(np.diff(vad['altitude']) >= 0)
+    assert len(vad['wind_barbs']) == 5
+
+
+def test_symbology_packet_overrun():
+    with pytest.raises(IOError):
+        VADFile.from_buffer(make_vwp(datetime(2013, 5, 20, 19, 30), layer=_overrun_layer()))
+
+
+def test_empty_table():
+    vad = VADFile.from_buffer(make_vwp(datetime(2013, 5, 20, 19, 30), num_levels=0))
+    assert len(vad['wind_dir']) == 0
+    assert len(vad['altitude']) == 0
+
+
+@pytest.mark.parametrize('chunk_size', [ 1 << 16, 37 ])
+def test_stream_skips_bad_symbology(chunk_size):
+    bad = make_vwp(datetime(2013, 5, 20, 19, 30), layer=_overrun_layer())
+    good = make_vwp(datetime(2013, 5, 20, 19, 35), seed=1)
+
+    vads = list(read_vad_stream(_feed(bad, good), chunk_size=chunk_size))
+    assert [ vad['time'] for vad in vads ] == [ datetime(2013, 5, 20, 19, 35) ]
+    assert vads[0].rid == 'KTLX'
+
+
+@pytest.mark.parametrize('chunk_size', [ 1 << 16, 37 ])
+def test_stream_skips_product_cut_in_symbology(chunk_size):
+    cut = make_vwp(datetime(2013, 5, 20, 19, 30))
+    good = make_vwp(datetime(2013, 5, 20, 19, 35), seed=1)
+
+    # Cut off partway into the symbology layer, which starts after the WMO heading and the first three headers.
+    vads = list(read_vad_stream(_feed(cut[:(30 + 18 + 102 + 16 + 20)], good), chunk_size=chunk_size))
+    assert [ vad['time'] for vad in vads ] == [ datetime(2013, 5, 20, 19, 35) ]
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from vad_reader import VADFile
+from vad_series import ParameterSeries
+from vwp_factory import make_vwp
+
+_start = datetime(2013, 5, 20, 19, 0)
+
+
+def _series(minutes):
+    series = ParameterSeries('KTLX')
+    for seed, mins in enumerate(minutes):
+        series.add(VADFile.from_buffer(make_vwp(_start + timedelta(minutes=mins), seed=seed)))
+    return series
+
+
+def test_trend():
+    series = _series(range(0, 65, 5))
+    srh = series.values('srh_1000m')
+
+    assert np.isclose(series.trend('srh_1000m', 30), srh[-1] - srh[-7])
+    assert len(series.trend('mean_wind', 30)) == 2
+
+
+def test_trend_not_enough_history():
+    series = _series(range(0, 25, 5))
+    assert series.trend('srh_1000m', 30) is None
+
+
+def test_trend_after_gap():
+    # Nothing between 0 and 60 minutes, so the closest one to 30 minutes ago is an hour old.
+    series = _series([ 0, 60, 65 ])
+    assert series.trend('srh_1000m', 30) is None
+    assert series.trend('srh_1000m', 30, tolerance=40) is not None
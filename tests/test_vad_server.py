@@ -0,0 +1,51 @@
+import os
+import json
+from datetime import datetime
+
+import pytest
+
+from vad_server import RenderServer
+from vwp_factory import make_vwp, file_name
+
+_time = datetime(2013, 5, 20, 19, 30)
+
+
+@pytest.fixture
+def server(tmpdir):
+    local_path = tmpdir.join('local')
+    local_path.ensure(dir=True)
+    local_path.join(file_name(_time)).write_binary(make_vwp(_time))
+    tmpdir.join('output').ensure(dir=True)
+
+    server = RenderServer(output=str(tmpdir.join('output')), local_path=str(local_path))
+    yield server
+    server.close()
+
+
+def _request(server, **request):
+    request.setdefault('radar_id', 'KTLX')
+    request.setdefault('time', '2013-05-20/1930')
+    return json.loads(server.handle_line(json.dumps(request)))
+
+
+def test_render_into_output(server, tmpdir):
+    response = _request(server, fname='KTLX.json')
+
+    assert 'error' not in response
+    assert response['filename'] == os.path.realpath(str(tmpdir.join('output', 'KTLX.json')))
+    assert os.path.exists(response['filename'])
+
+
+@pytest.mark.parametrize('fname', [ '../escape.json', '/tmp/escape.json', 'link/escape.json' ])
+def test_fname_outside_output(server, tmpdir, fname):
+    tmpdir.join('output', 'link').mksymlinkto(tmpdir)
+    response = _request(server, fname=fname)
+
+    assert "isn't in the output directory" in response['error']
+    assert not tmpdir.join('escape.json').exists()
+
+
+@pytest.mark.parametrize('key', [ 'local_path', 'cache_path' ])
+def test_client_paths_refused(server, tmpdir, key):
+    response = _request(server, **{key: str(tmpdir)})
+    assert "can only be set when starting the server" in response['error']
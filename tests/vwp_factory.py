@@ -0,0 +1,84 @@
+from __future__ import print_function
+
+import math
+import random
+import struct
+from datetime import datetime
+
+"""
+Builds synthetic NIDS VWP products (product code 48) with a symbology block (a text packet and some wind barbs) and a
+tabular block holding the VAD Algorithm Output table, laid out like the ones off the NWS server.
+"""
+
+_epoch = datetime(1969, 12, 31)
+
+
+def _product_description(code, date, secs, offset_symbology, offset_tabular):
+    values = [ -1, 35333, -97278, 1200, code, 2, 212, 1, 3, date, secs, date, secs + 120, 0, 0, 0, 0 ]
+    values += [ 0 ] * 16 + [ 0 ] * 7 + [ 1, 0, offset_symbology, 0, offset_tabular ]
+    return struct.pack('>hiihhhhhhhihihhhh16h7hbbiii', *values)
+
+
+def _message_header(code, date, secs, length):
+    return struct.pack('>hhiihhh', code, date, secs, length, 1, 0, 3)
+
+
+def symbology_layer(num_barbs=5):
+    text = b'12:00Z'
+    layer = struct.pack('>hhhhh', 8, 6 + len(text), 1, 10, 20) + text
+    for idx in range(num_barbs):
+        layer += struct.pack('>hhhhhhh', 4, 10, 2, 40 * idx, 300, 10 * idx, 20 + idx)
+    return layer
+
+
+def vad_table(valid_time, num_levels=20, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for idx, alt in enumerate(sorted(rnd.sample(range(1, 400), num_levels))):
+        wind_dir = rnd.randint(0, 359)
+        wind_spd = rnd.randint(1, 80)
+        div = 'NA' if idx % 5 == 0 else '%5.1f' % rnd.uniform(-5, 5)
+        elev = rnd.choice([ 0.5, 1.5, 2.4, 3.4, 4.3, 6.0, 9.9, 19.5 ])
+        srng = alt * 0.3048 * 100 / 1852. / max(0.05, math.sin(math.radians(elev)))
+        rows.append(" %5d %5.1f %5.1f %5s   %03d   %03d %5.1f %5s %6.2f %5.1f" %
+                    (alt, 1.0, 2.0, 'NA', wind_dir, wind_spd, rnd.uniform(0, 6), div, srng, elev))
+
+    header = [ "                      VAD Algorithm Output   %s" % valid_time.strftime("%m/%d/%y  %H:%M"),
+               "  ALT    U     V     W    DIR   SPD   RMS   DIV   SRNG  ELEV",
+               " 100ft  m/s   m/s  cm/s   deg   kts   kts  E-3/s   nm   deg" ]
+    pages = [ [ "  VAD PARAMETERS", "" ] ]
+    for idx in range(0, len(rows), 12):
+        pages.append(header + rows[idx:(idx + 12)])
+    return pages
+
+
+def make_vwp(valid_time, num_levels=20, seed=0, code=48, layer=None, site='KOUN', awips_id='NVWTLX'):
+    date = (valid_time - _epoch).days
+    secs = (valid_time - _epoch).seconds
+
+    if layer is None:
+        layer = symbology_layer()
+
+    pages = vad_table(valid_time, num_levels=num_levels, seed=seed)
+    text = b''
+    for page in pages:
+        for line in page:
+            line = line.ljust(80).encode('ascii')
+            text += struct.pack('>h', len(line)) + line
+        text += struct.pack('>h', -1)
+
+    symbology = struct.pack('>hhihhi', -1, 1, 16 + len(layer), 1, -1, len(layer)) + layer
+    offset_symbology = (18 + 102) // 2
+    offset_tabular = offset_symbology + len(symbology) // 2
+
+    tabular = _message_header(code, date, secs, 0) + _product_description(code, date, secs, 0, 0)
+    tabular += struct.pack('>hh', -1, len(pages)) + text
+    tabular = struct.pack('>hhi', -1, 3, 8 + len(tabular)) + tabular
+
+    body = _product_description(code, date, secs, offset_symbology, offset_tabular) + symbology + tabular
+    wmo = ("SDUS34 %s %s\r\r\n%s\r\r\n" % (site, valid_time.strftime("%d%H%M"), awips_id)).encode('ascii')
+    return wmo + _message_header(code, date, secs, 18 + len(body)) + body
+
+
+def file_name(valid_time, site='KOUN', awips_id='NVWTLX'):
+    return "%s_SDUS34_%s_%s" % (site, awips_id, valid_time.strftime("%Y%m%d%H%M"))
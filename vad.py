@@ -5,16 +5,18 @@ import numpy as np
 
 import sys
 
-from vad_reader import download_vad, VADFile
-from params import compute_parameters
-from plot import plot_hodograph
-from wsr88d import build_has_name
+from vad_reader import download_vad, find_file_times
+from params import compute_parameters, Profile
+from hodo_scene import is_scene_file, write_hodograph
+from vad_index import VADIndex, load_local_vad
+from vad_cache import VADCache
 
 import re
 import argparse
 from datetime import datetime, timedelta
 import json
 import glob
+from concurrent.futures import ThreadPoolExecutor
 
 """
 vad.py
@@ -62,8 +64,49 @@ def parse_time(time_str):
 
     return plot_time
 
+def load_vad(radar_id, plot_time, local_path=None, cache_path=None, pool=None, index=None, index_path=None):
+    if local_path is None:
+        vad = download_vad(radar_id, time=plot_time, cache_path=cache_path, pool=pool)
+    else:
+        vad = load_local_vad(local_path, radar_id, plot_time, index=index, index_path=index_path)
+
+    vad.rid = radar_id
+    return vad
+
+def load_vad_range(radar_id, start, end, local_path=None, cache_path=None, pool=None, download_workers=8, index=None,
+                   index_path=None):
+    if local_path is not None:
+        own_index = index is None
+        if own_index:
+            index = VADIndex(local_path, index_path=index_path)
+        try:
+            if own_index:
+                index.refresh()
+            entries = index.find_range(radar_id, start, end)
+            vads = index.load_many(entries)
+        finally:
+            if own_index:
+                index.close()
+    else:
+        # One listing for the whole range, then fetch the files in parallel.
+        file_dts = sorted(dt for name, dt in find_file_times(radar_id, pool=pool) if start <= dt <= end)
+
+        def download(file_dt):
+            return download_vad(radar_id, time=file_dt, cache_path=cache_path, pool=pool)
+
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+            vads = list(download_pool.map(download, file_dts))
+
+    # A file can get replaced while we're downloading, so we could get the same volume twice.
+    loop_vads = []
+    for vad in vads:
+        if len(loop_vads) == 0 or vad['time'] > loop_vads[-1]['time']:
+            vad.rid = radar_id
+            loop_vads.append(vad)
+    return loop_vads
+
 def vad_plotter(radar_id, storm_motion='right-mover', sfc_wind=None, time=None, fname=None, local_path=None, 
-                cache_path=None, web=False, fixed=False):
+                cache_path=None, web=False, fixed=False, index_path=None):
     plot_time = None
     if time:
         plot_time = parse_time(time)
@@ -73,13 +116,7 @@ def vad_plotter(radar_id, storm_motion='right-mover', sfc_wind=None, time=None,
     if not web:
         print("Plotting VAD for %s ..." % radar_id)
 
-    if local_path is None:
-        vad = download_vad(radar_id, time=plot_time, cache_path=cache_path)
-    else:
-        iname = build_has_name(radar_id, plot_time)
-        vad = VADFile(open("%s/%s" % (local_path, iname), 'rb'))
-
-    vad.rid = radar_id
+    vad = load_vad(radar_id, plot_time, local_path=local_path, cache_path=cache_path, index_path=index_path)
 
     if not web:
         print("Valid time:", vad['time'].strftime("%d %B %Y %H%M UTC"))
@@ -88,8 +125,17 @@ def vad_plotter(radar_id, storm_motion='right-mover', sfc_wind=None, time=None,
         sfc_wind = parse_vector(sfc_wind)
         vad.add_surface_wind(sfc_wind)
 
-    params = compute_parameters(vad, storm_motion)
-    plot_hodograph(vad, params, fname=fname, web=web, fixed=fixed, archive=(local_path is not None))
+    prof = Profile(vad)
+    params = compute_parameters(prof, storm_motion)
+
+    if is_scene_file(fname):
+        bounds = write_hodograph(prof, params, fname, fixed=fixed)
+        if web:
+            print(json.dumps(bounds))
+    else:
+        # Only pull in matplotlib if we're actually drawing an image
+        from plot import plot_hodograph
+        plot_hodograph(prof, params, fname=fname, web=web, fixed=fixed, archive=(local_path is not None))
 
 
 def main():
@@ -98,15 +144,24 @@ def main():
     ap.add_argument('-m', '--storm-motion', dest='storm_motion', help="Storm motion vector. It takes one of two forms. The first is either 'BRM' for the Bunkers right mover vector, or 'BLM' for the Bunkers left mover vector. The second is the form DDD/SS, where DDD is the direction the storm is coming from, and SS is the speed in knots (e.g. 240/25).", default='right-mover')
     ap.add_argument('-s', '--sfc-wind', dest='sfc_wind', help="Surface wind vector. It takes the form DDD/SS, where DDD is the direction the storm is coming from, and SS is the speed in knots (e.g. 240/25).")
     ap.add_argument('-t', '--time', dest='time', help="Time to plot. Takes the form DD/HHMM, where DD is the day, HH is the hour, and MM is the minute.")
-    ap.add_argument('-f', '--img-name', dest='img_name', help="Name of the file produced.")
+    ap.add_argument('-f', '--img-name', dest='img_name', help="Name of the file produced. Names ending in .svg or .json give a vector image or a JSON description of the hodograph, drawn without matplotlib.")
     ap.add_argument('-p', '--local-path', dest='local_path', help="Path to local data. If not given, download from the Internet.")
-    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here.")
+    ap.add_argument('-I', '--index-path', dest='index_path', help="File in which to keep the index of the local data. Defaults to .vad_index.sqlite in the local path, or a file in ~/.cache/vad-plotter if the local path can't be written to.")
+    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here, and read from here if already downloaded.")
+    ap.add_argument('--cache-size', dest='cache_size', type=float, help="Maximum size of the local cache in MB. The least recently used files are removed first.")
+    ap.add_argument('--cache-age', dest='cache_age', type=float, help="Maximum time in hours since a file in the local cache was last used.")
     ap.add_argument('-w', '--web-mode', dest='web', action='store_true')
     ap.add_argument('-x', '--fixed-frame', dest='fixed', action='store_true')
     args = ap.parse_args()
 
     np.seterr(all='ignore')
 
+    cache_path = args.cache_path
+    if cache_path is not None:
+        max_bytes = None if args.cache_size is None else args.cache_size * 1024 * 1024
+        max_age = None if args.cache_age is None else args.cache_age * 3600
+        cache_path = VADCache(cache_path, max_bytes=max_bytes, max_age=max_age)
+
     try:
         vad_plotter(args.radar_id,
             storm_motion=args.storm_motion,
@@ -114,9 +169,10 @@ def main():
             time=args.time,
             fname=args.img_name,
             local_path=args.local_path,
-            cache_path=args.cache_path,
+            cache_path=cache_path,
             web=args.web,
-            fixed=args.fixed
+            fixed=args.fixed,
+            index_path=args.index_path
         )
     except:
         if args.web:
@@ -0,0 +1,93 @@
+from __future__ import print_function
+
+import os
+import bz2
+import gzip
+import tarfile
+from collections import namedtuple
+
+from vad_reader import VADFile
+from wsr88d import parse_has_name
+
+"""
+Reads VWPs straight out of the archive bundles NCEI sends (.tar, .tar.gz, .tar.bz2, or a single .gz or .bz2 file)
+without extracting them. The offset of each member is into the uncompressed stream, so for an uncompressed tarball it
+can be read straight out of the file, and for a compressed one the stream is decompressed up to it.
+"""
+
+ArchiveMember = namedtuple('ArchiveMember', ['name', 'offset', 'size', 'data'])
+
+_gzip_magic = b"\x1f\x8b"
+_bz2_magic = b"BZh"
+
+
+def _compression(path):
+    with open(path, 'rb') as farc:
+        magic = farc.read(3)
+
+    if magic.startswith(_gzip_magic):
+        return 'gz'
+    elif magic.startswith(_bz2_magic):
+        return 'bz2'
+    return None
+
+
+def _open_stream(path):
+    compression = _compression(path)
+    if compression == 'gz':
+        return gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        return bz2.BZ2File(path, 'rb')
+    return open(path, 'rb')
+
+
+def is_compressed(path):
+    return _compression(path) is not None
+
+
+def is_archive(path):
+    return is_compressed(path) or tarfile.is_tarfile(path)
+
+
+def iter_members(path):
+    if tarfile.is_tarfile(path):
+        # Stream the members in the order they're stored, so a compressed archive only gets decompressed once.
+        with tarfile.open(path, 'r|*') as tar:
+            for member in tar:
+                if member.isfile() and not os.path.basename(member.name).startswith('.'):
+                    yield ArchiveMember(member.name, member.offset_data, member.size, tar.extractfile(member).read())
+    else:
+        # Just the one file, compressed
+        with _open_stream(path) as farc:
+            data = farc.read()
+        yield ArchiveMember(os.path.splitext(os.path.basename(path))[0], 0, len(data), data)
+
+
+def iter_vads(path, tabular_only=False, lazy=False):
+    for member in iter_members(path):
+        try:
+            radar_id = parse_has_name(os.path.basename(member.name))[0]
+        except ValueError:
+            continue
+
+        vad = VADFile.from_buffer(member.data, tabular_only=tabular_only, lazy=lazy)
+        vad.rid = radar_id
+        yield member, vad
+
+
+def read_members(path, spans):
+    # Seeking forward in a compressed stream only decompresses what's skipped, so going in order of offset reads the
+    # whole lot in one pass.
+    order = sorted(range(len(spans)), key=lambda idx: spans[idx][0])
+    members = [ None ] * len(spans)
+
+    with _open_stream(path) as farc:
+        for idx in order:
+            offset, size = spans[idx]
+            farc.seek(offset)
+            members[idx] = farc.read(size)
+    return members
+
+
+def read_member(path, offset, size):
+    return read_members(path, [ (offset, size) ])[0]
@@ -0,0 +1,284 @@
+from __future__ import print_function
+
+import re
+import time
+import asyncio
+from collections import defaultdict
+from urllib.parse import urlparse
+from urllib.request import URLError
+
+from vad_reader import VADFile, default_listing_cache, listing_url, file_url, parse_listing, file_before, open_cache, \
+    needs_listing, select_file, file_cache_key, download_failed, finish_download
+
+"""
+Asyncio versions of find_file_times, find_file_before, and download_vad, for use from an event loop. They take the
+same arguments as the ones in vad_reader and share the listing cache and file cache, but the downloads go through an
+AsyncFTPPool instead of blocking on urlopen. A file is read out of the cache on the event loop, since it's only a few
+KB, but writing to the cache (which can go through the whole cache directory to evict old files) happens in the
+loop's executor, as does everything to do with the listing cache, which is kept on the disk with a cache_path.
+"""
+
+_ftp_port = 21
+_pasv_re = re.compile(r"(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)")
+
+
+class FTPError(Exception):
+    pass
+
+
+class FTPPermError(FTPError):
+    pass
+
+
+class _FTPConnection(object):
+    def __init__(self, host, reader, writer):
+        self.host = host
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def open(cls, host, port, user, passwd):
+        reader, writer = await asyncio.open_connection(host, port)
+        conn = cls(host, reader, writer)
+        try:
+            await conn._expect(conn._response(), 220)
+
+            code, msg = await conn.command("USER %s" % user)
+            if code == 331:
+                code, msg = await conn.command("PASS %s" % passwd)
+            conn._check(code, msg, 230)
+
+            await conn._expect(conn.command("TYPE I"), 200)
+        except:
+            conn.close()
+            raise
+        return conn
+
+    async def command(self, cmd):
+        self._writer.write(("%s\r\n" % cmd).encode('latin-1'))
+        await self._writer.drain()
+        return await self._response()
+
+    async def transfer(self, cmd):
+        code, msg = await self._expect(self.command("PASV"), 227)
+        match = _pasv_re.search(msg)
+        if match is None:
+            raise FTPError(msg)
+
+        # Like ftplib, connect to the same host as the control connection, whatever address the server gives.
+        h1, h2, h3, h4, p1, p2 = [ int(num) for num in match.groups() ]
+        data_reader, data_writer = await asyncio.open_connection(self.host, p1 * 256 + p2)
+        try:
+            code, msg = await self.command(cmd)
+            self._check(code, msg, 125, 150)
+            data = await data_reader.read()
+        finally:
+            data_writer.close()
+
+        await self._expect(self._response(), 226, 250)
+        return data
+
+    def close(self):
+        self._writer.close()
+
+    async def quit(self):
+        try:
+            await self.command("QUIT")
+        except (FTPError, OSError, EOFError):
+            pass
+        self.close()
+
+    async def _response(self):
+        line = await self._readline()
+        code = line[:3]
+        lines = [ line ]
+        if line[3:4] == '-':
+            # A multi-line response goes until a line starting with the same code and a space
+            while not (line[:3] == code and line[3:4] == ' '):
+                line = await self._readline()
+                lines.append(line)
+
+        try:
+            return int(code), "\n".join(lines)
+        except ValueError:
+            raise FTPError("Bad response from the server: '%s'" % lines[0])
+
+    async def _readline(self):
+        line = await self._reader.readline()
+        if not line:
+            raise EOFError("The server closed the connection.")
+        return line.decode('latin-1').rstrip("\r\n")
+
+    async def _expect(self, response, *codes):
+        code, msg = await response
+        self._check(code, msg, *codes)
+        return code, msg
+
+    def _check(self, code, msg, *codes):
+        if code in codes:
+            return
+        if 500 <= code < 600:
+            raise FTPPermError(msg)
+        raise FTPError(msg)
+
+
+class AsyncFTPPool(object):
+    def __init__(self, max_per_host=4, timeout=30, retries=3, backoff=0.5, max_idle=60):
+        self._max_per_host = max_per_host
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_idle = max_idle
+
+        self._idle = defaultdict(list)
+        self._slots = {}
+        self._in_flight = {}
+
+    async def fetch(self, url):
+        return await self._shared(('RETR', url), lambda: self._run(url, "RETR %s"))
+
+    async def listing(self, url):
+        data = await self._shared(('LIST', url), lambda: self._run(url, "LIST %s"))
+        return data.decode('utf-8')
+
+    async def close(self):
+        idle = [ conn for conns in self._idle.values() for conn, last_used in conns ]
+        self._idle.clear()
+
+        for conn in idle:
+            await conn.quit()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _shared(self, key, start):
+        # Hundreds of requests for the same radar at once should only go to the server once.
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(start())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key, None))
+
+        # Shielded so one caller giving up doesn't cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def _run(self, url, cmd):
+        parsed = urlparse(url)
+        if parsed.scheme != 'ftp':
+            raise ValueError("AsyncFTPPool can't fetch '%s'" % url)
+
+        key = (parsed.hostname, parsed.port or _ftp_port, parsed.username or 'anonymous', parsed.password or '')
+        path = re.sub("/+", "/", parsed.path) or "/"
+
+        if key not in self._slots:
+            self._slots[key] = asyncio.Semaphore(self._max_per_host)
+        slot = self._slots[key]
+
+        for attempt in range(self._retries + 1):
+            async with slot:
+                conn = None
+                try:
+                    conn = await asyncio.wait_for(self._checkout(key), self._timeout)
+                    result = await asyncio.wait_for(conn.transfer(cmd % path), self._timeout)
+                except FTPPermError as exc:
+                    # Permanent errors (e.g. no such file) won't go away by retrying, but the connection is fine.
+                    if conn is not None:
+                        self._checkin(key, conn)
+                    raise URLError(exc)
+                except (FTPError, OSError, EOFError, asyncio.TimeoutError) as exc:
+                    if conn is not None:
+                        conn.close()
+
+                    if attempt == self._retries:
+                        raise URLError(exc)
+                else:
+                    self._checkin(key, conn)
+                    return result
+
+            await asyncio.sleep(self._backoff * 2 ** attempt)
+
+    async def _checkout(self, key):
+        now = time.time()
+        idle = self._idle[key]
+        while idle:
+            conn, last_used = idle.pop()
+            if now - last_used < self._max_idle:
+                return conn
+            conn.close()
+
+        host, port, user, passwd = key
+        return await _FTPConnection.open(host, port, user, passwd)
+
+    def _checkin(self, key, conn):
+        self._idle[key].append((conn, time.time()))
+
+
+async def _get_file_times(rid, listing_cache=None, pool=None, base_url=None):
+    if listing_cache is None:
+        listing_cache = default_listing_cache
+
+    file_list = await _in_executor(listing_cache.get, rid)
+    if file_list is None:
+        file_list = parse_listing(rid, await pool.listing(listing_url(rid, base_url=base_url)))
+        await _in_executor(listing_cache.put, rid, file_list)
+    return file_list
+
+
+async def find_file_times(rid, listing_cache=None, pool=None, base_url=None):
+    async with _PoolScope(pool) as pool:
+        file_names, file_dts = await _get_file_times(rid, listing_cache=listing_cache, pool=pool, base_url=base_url)
+    return list(zip(file_names, file_dts))[::-1]
+
+
+async def find_file_before(rid, time, listing_cache=None, pool=None, base_url=None):
+    async with _PoolScope(pool) as pool:
+        file_list = await _get_file_times(rid, listing_cache=listing_cache, pool=pool, base_url=base_url)
+    return file_before(file_list, time)
+
+
+async def download_vad(rid, time=None, file_id=None, cache_path=None, listing_cache=None, pool=None, base_url=None,
+                       file_list=None):
+    cache, listing_cache = open_cache(cache_path, listing_cache)
+
+    async with _PoolScope(pool) as pool:
+        if file_list is None and needs_listing(time, cache):
+            file_list = await _get_file_times(rid, listing_cache=listing_cache, pool=pool, base_url=base_url)
+        file_name, file_dt = select_file(file_list, time=time, file_id=file_id)
+
+        cache_key = file_cache_key(rid, file_name, file_dt, cache)
+        if cache_key is not None:
+            data = cache.get(cache_key)
+            if data is not None:
+                return VADFile.from_buffer(data, lazy=True)
+
+        try:
+            data = await pool.fetch(file_url(rid, file_name, base_url=base_url))
+        except URLError:
+            await _in_executor(download_failed, rid, file_dt, listing_cache)
+
+    if cache is None:
+        return finish_download(rid, data, file_dt, cache, cache_key, listing_cache)
+    return await _in_executor(finish_download, rid, data, file_dt, cache, cache_key, listing_cache)
+
+
+async def _in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class _PoolScope(object):
+    # Use the caller's pool, or one just for this call if there isn't one.
+    def __init__(self, pool):
+        self._pool = pool
+        self._own = pool is None
+
+    async def __aenter__(self):
+        if self._own:
+            self._pool = AsyncFTPPool()
+        return self._pool
+
+    async def __aexit__(self, *exc):
+        if self._own:
+            await self._pool.close()
@@ -0,0 +1,224 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import sys
+import zlib
+import json
+import time
+import tarfile
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from vad_reader import VADFile
+from params import compute_parameters, nullify, Profile
+from vad_archive import is_archive, iter_members
+from vad_store import VADStore
+from wsr88d import parse_has_name
+
+_state_name = ".backfill.json"
+_chunk_fmt = "backfill-%06d.jsonl"
+
+
+def walk_dir(root):
+    # Sorted, so the order is the same every time and a checkpoint is just a count.
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(dn for dn in dir_names if not dn.startswith('.'))
+        for fn in sorted(file_names):
+            if fn.startswith('.'):
+                continue
+
+            path = os.path.join(dir_path, fn)
+            if is_archive(path):
+                # The bundles NCEI sends, read member by member the same as a bundle given as the source
+                for item in walk_archive(path):
+                    yield item
+            else:
+                yield path, None
+
+
+def walk_archive(path):
+    # Each member is named by its path inside the bundle, after the path to the bundle.
+    try:
+        for member in iter_members(path):
+            yield os.path.join(path, member.name), member.data
+    except (IOError, EOFError, zlib.error, tarfile.TarError):
+        # A truncated or corrupt bundle. Keep what came out of it before the bad spot, and pass the error along so it
+        #   ends up in the output with the rest.
+        yield path, sys.exc_info()[1]
+
+
+def _walk(source):
+    if os.path.isdir(source):
+        return walk_dir(source)
+    return walk_archive(source)
+
+
+def _process(name, data, radar_id, storm_motion, keep_profile):
+    try:
+        if isinstance(data, Exception):
+            # It couldn't be read out of its bundle.
+            raise data
+
+        if radar_id is None:
+            radar_id = parse_has_name(os.path.basename(name))[0]
+
+        if data is None:
+            vad = VADFile.from_path(name)
+        else:
+            vad = VADFile.from_buffer(data)
+
+        params = compute_parameters(Profile(vad), storm_motion)
+    except Exception:
+        # One bad file in fifteen years of them shouldn't stop the whole run.
+        typ, val, trace = sys.exc_info()
+        return {'source': name, 'error': "%s: %s" % (typ.__name__, val)}, None
+
+    record = {
+        'source': name,
+        'radar_id': radar_id,
+        'valid_time': vad['time'].strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'vcp': int(vad['vcp']),
+        'parameters': dict((key, nullify(val)) for key, val in params.items()),
+    }
+
+    profile = None
+    if keep_profile:
+        profile = dict((col, np.asarray(vad[col], dtype=np.float32)) for col in VADStore.columns)
+        profile['time'] = vad['time']
+    return record, profile
+
+
+class Checkpoint(object):
+    def __init__(self, output, source):
+        self.path = os.path.join(output, _state_name)
+        self.source = os.path.abspath(source)
+        self.items = 0
+        self.chunks = 0
+        self.last = None
+
+        try:
+            with open(self.path) as fstate:
+                state = json.load(fstate)
+        except IOError:
+            return
+
+        if state['source'] != self.source:
+            raise ValueError("'%s' has a checkpoint for '%s'." % (output, state['source']))
+        self.items = state['items']
+        self.chunks = state['chunks']
+        self.last = state['last']
+
+    def skip(self, items):
+        # Throw away what was done before, making sure it's what was there last time.
+        last = None
+        for name, data in islice(items, self.items):
+            last = name
+        if last != self.last:
+            raise ValueError("'%s' has changed since the last run (expected '%s' at item %d, got '%s')." %
+                             (self.source, self.last, self.items, last))
+        return items
+
+    def save(self, num_items, last):
+        self.items += num_items
+        self.chunks += 1
+        self.last = last
+
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, 'w') as fstate:
+            json.dump({'source': self.source, 'items': self.items, 'chunks': self.chunks, 'last': self.last}, fstate)
+        os.rename(tmp_path, self.path)
+
+
+def _write_chunk(output, chunk_idx, records):
+    # Written to the side and moved into place, so a chunk is either all there or not there at all.
+    fname = os.path.join(output, _chunk_fmt % chunk_idx)
+    with open(fname + ".tmp", 'w') as fchunk:
+        for record in records:
+            fchunk.write(json.dumps(record) + "\n")
+    os.rename(fname + ".tmp", fname)
+    return fname
+
+
+def backfill(source, output, storm_motion='right-mover', radar_id=None, store=None, chunk_size=1000, workers=None,
+             progress=sys.stderr):
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    checkpoint = Checkpoint(output, source)
+    items = checkpoint.skip(_walk(source))
+    if checkpoint.items > 0:
+        print("Resuming after %d files" % checkpoint.items, file=progress)
+
+    vad_store = VADStore(store) if store is not None else None
+
+    def finish(chunk, futures):
+        records = []
+        profiles = {}
+        for fut in futures:
+            record, profile = fut.result()
+            records.append(record)
+            if profile is not None:
+                profiles.setdefault(record['radar_id'], []).append(profile)
+
+        _write_chunk(output, checkpoint.chunks, records)
+        for rid, rid_profiles in profiles.items():
+            vad_store.append_many(rid, rid_profiles)
+
+        # Only count the chunk as done once everything from it is on the disk.
+        checkpoint.save(len(chunk), chunk[-1][0])
+        return sum(1 for record in records if 'error' in record)
+
+    num_items = 0
+    num_errors = 0
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep one chunk in the pool while the last one is written out. Only two chunks are ever in memory.
+        pending = None
+        while True:
+            chunk = list(islice(items, chunk_size))
+            if len(chunk) > 0:
+                futures = [ pool.submit(_process, name, data, radar_id, storm_motion, vad_store is not None)
+                            for name, data in chunk ]
+
+            if pending is not None:
+                num_errors += finish(*pending)
+                num_items += len(pending[0])
+                elapsed = time.time() - start
+                print("%d files (%d errors) in %.0f s, %.1f files/s" % (num_items, num_errors, elapsed, num_items / elapsed),
+                      file=progress)
+                progress.flush()
+
+            if len(chunk) == 0:
+                break
+            pending = (chunk, futures)
+
+    return num_items, num_errors
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('source', help="Directory of VWP files and bundles of them, or a single bundle.")
+    ap.add_argument('-o', '--output', dest='output', required=True, help="Path in which to put the parameters (as chunks of JSON lines) and the checkpoint. Run again with the same output path to pick up where a killed run left off.")
+    ap.add_argument('-m', '--storm-motion', dest='storm_motion', help="Storm motion vector. Takes the same forms as in vad.py.", default='right-mover')
+    ap.add_argument('-r', '--radar-id', dest='radar_id', help="Radar for every file in the source. If not given, it comes from the file names.")
+    ap.add_argument('-s', '--store', dest='store', help="Path to a columnar store (see vad_store.py). If given, the profiles are appended to it as well.")
+    ap.add_argument('-n', '--chunk-size', dest='chunk_size', type=int, default=1000, help="Number of files in each chunk of output.")
+    ap.add_argument('-j', '--workers', dest='workers', type=int, help="Number of parsing processes. Defaults to the number of CPUs.")
+    args = ap.parse_args()
+
+    np.seterr(all='ignore')
+
+    backfill(args.source, args.output,
+        storm_motion=args.storm_motion,
+        radar_id=args.radar_id,
+        store=args.store,
+        chunk_size=args.chunk_size,
+        workers=args.workers
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from ftp_pool import FTPPool
+from params import compute_parameters, Profile
+from plot import HodographPlot
+from vad import parse_time, parse_vector, load_vad
+from vad_index import VADIndex
+from wsr88d import all_radar_ids
+
+
+# One figure per render process, so the cached backgrounds get reused from one radar to the next.
+_hodo = None
+
+def render_vad(vad, storm_motion, sfc_wind, fname, fixed, archive, bounds=None):
+    global _hodo
+    np.seterr(all='ignore')
+
+    if sfc_wind:
+        vad.add_surface_wind(parse_vector(sfc_wind))
+
+    prof = Profile(vad)
+    params = compute_parameters(prof, storm_motion)
+
+    if _hodo is None:
+        _hodo = HodographPlot()
+    _hodo.render(prof, params, fname=fname, fixed=fixed, archive=archive, bounds=bounds)
+
+
+def report(radar_id, **kwargs):
+    status = {'radar_id': radar_id}
+    status.update(kwargs)
+    print(json.dumps(status))
+    sys.stdout.flush()
+
+
+def report_error(radar_id):
+    typ, val, trace = sys.exc_info()
+    report(radar_id, error="%s: %s" % (typ.__name__, val))
+
+
+def vad_batch(radar_ids, storm_motion='right-mover', sfc_wind=None, time=None, output='.', local_path=None,
+              cache_path=None, fixed=False, download_workers=16, render_workers=None, index_path=None):
+    plot_time = None
+    if time:
+        plot_time = parse_time(time)
+    elif local_path is not None:
+        raise ValueError("'-t' ('--time') argument is required when loading from the local disk.")
+
+    index = None
+    if local_path is not None:
+        # One index for the whole run, brought up to date once, rather than every radar walking the tree on its own
+        index = VADIndex(local_path, index_path=index_path)
+        index.update()
+
+    try:
+        with FTPPool(max_per_host=download_workers) as ftp_pool, \
+                ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+                ProcessPoolExecutor(max_workers=render_workers) as render_pool:
+
+            downloads = {}
+            for radar_id in radar_ids:
+                fut = download_pool.submit(load_vad, radar_id, plot_time, local_path=local_path, cache_path=cache_path,
+                                           pool=ftp_pool, index=index)
+                downloads[fut] = radar_id
+
+            renders = {}
+            for fut in as_completed(downloads):
+                radar_id = downloads[fut]
+                try:
+                    vad = fut.result()
+                except Exception:
+                    report_error(radar_id)
+                    continue
+
+                fname = os.path.join(output, "%s_vad.png" % radar_id)
+                fut = render_pool.submit(render_vad, vad, storm_motion, sfc_wind, fname, fixed, local_path is not None)
+                renders[fut] = (radar_id, vad['time'], fname)
+
+            for fut in as_completed(renders):
+                radar_id, valid_time, fname = renders[fut]
+                try:
+                    fut.result()
+                except Exception:
+                    report_error(radar_id)
+                    continue
+
+                report(radar_id, valid_time=valid_time.strftime("%Y-%m-%dT%H:%M:%SZ"), filename=fname)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('radar_ids', nargs='+', help="The 4-character identifiers for the radars (e.g. KTLX KFWS), or 'all' for every WSR-88D and TDWR.")
+    ap.add_argument('-m', '--storm-motion', dest='storm_motion', help="Storm motion vector. Takes the same forms as in vad.py.", default='right-mover')
+    ap.add_argument('-s', '--sfc-wind', dest='sfc_wind', help="Surface wind vector. Takes the form DDD/SS. The same surface wind is used for every radar.")
+    ap.add_argument('-t', '--time', dest='time', help="Time to plot. Takes the form DD/HHMM, where DD is the day, HH is the hour, and MM is the minute.")
+    ap.add_argument('-o', '--output', dest='output', default='.', help="Path in which to put the images.")
+    ap.add_argument('-p', '--local-path', dest='local_path', help="Path to local data. If not given, download from the Internet.")
+    ap.add_argument('-I', '--index-path', dest='index_path', help="File in which to keep the index of the local data. Defaults to the same as in vad.py.")
+    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here.")
+    ap.add_argument('-x', '--fixed-frame', dest='fixed', action='store_true')
+    ap.add_argument('-j', '--download-workers', dest='download_workers', type=int, default=16, help="Number of simultaneous downloads.")
+    ap.add_argument('-r', '--render-workers', dest='render_workers', type=int, help="Number of rendering processes. Defaults to the number of CPUs.")
+    args = ap.parse_args()
+
+    if [ rid.lower() for rid in args.radar_ids ] == ['all']:
+        radar_ids = all_radar_ids()
+    else:
+        radar_ids = [ rid.upper() for rid in args.radar_ids ]
+
+    np.seterr(all='ignore')
+
+    vad_batch(radar_ids,
+        storm_motion=args.storm_motion,
+        sfc_wind=args.sfc_wind,
+        time=args.time,
+        output=args.output,
+        local_path=args.local_path,
+        index_path=args.index_path,
+        cache_path=args.cache_path,
+        fixed=args.fixed,
+        download_workers=args.download_workers,
+        render_workers=args.render_workers
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from __future__ import print_function
+
+import os
+import time
+import tempfile
+
+_key_dir = ".keys"
+_tmp_prefix = ".tmp."
+_tmp_max_age = 3600
+
+
+class VADCache(object):
+    def __init__(self, cache_path, max_bytes=None, max_age=None):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._key_path = os.path.join(cache_path, _key_dir)
+        try:
+            os.makedirs(self._key_path)
+        except OSError:
+            if not os.path.isdir(self._key_path):
+                raise
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self._key_path, key)) as fkey:
+                name = fkey.read().strip()
+
+            path = os.path.join(self.cache_path, name)
+            with open(path, 'rb') as fvad:
+                data = fvad.read()
+        except (IOError, OSError):
+            return None
+
+        # The modification time is the last use for the purposes of eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, name, data):
+        self._write(self.cache_path, name, data)
+        if key is not None:
+            self._write(self._key_path, key, name.encode('utf-8'))
+
+        if self.max_bytes is not None or self.max_age is not None:
+            self.evict()
+
+    def evict(self):
+        now = time.time()
+
+        entries = []
+        for name in os.listdir(self.cache_path):
+            path = os.path.join(self.cache_path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            if name.startswith(_tmp_prefix):
+                # Left behind by a process that died in the middle of a write
+                if now - stat.st_mtime > _tmp_max_age:
+                    _remove(path)
+            elif not name.startswith('.') and os.path.isfile(path):
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        entries.sort()
+        total_bytes = sum(size for mtime, size, name in entries)
+        kept = set(name for mtime, size, name in entries)
+
+        for mtime, size, name in entries:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_big = self.max_bytes is not None and total_bytes > self.max_bytes
+            if not (too_old or too_big):
+                break
+
+            _remove(os.path.join(self.cache_path, name))
+            total_bytes -= size
+            kept.discard(name)
+
+        for key in os.listdir(self._key_path):
+            key_path = os.path.join(self._key_path, key)
+            try:
+                with open(key_path) as fkey:
+                    name = fkey.read().strip()
+            except (IOError, OSError):
+                continue
+
+            if name not in kept and not os.path.exists(os.path.join(self.cache_path, name)):
+                _remove(key_path)
+
+    def _write(self, path, name, data):
+        # Write to a temporary file and move it into place so no other process ever sees a partial file.
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_path, prefix=_tmp_prefix)
+        try:
+            with os.fdopen(fd, 'wb') as ftmp:
+                ftmp.write(data)
+            os.rename(tmp_name, os.path.join(path, name))
+        except:
+            _remove(tmp_name)
+            raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
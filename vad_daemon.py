@@ -0,0 +1,213 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import signal
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from ftp_pool import FTPPool
+from params import nullify
+from vad_reader import download_vad, listing_url, parse_listing
+from vad_batch import render_vad, report, report_error
+from vad_series import ParameterService
+from wsr88d import all_radar_ids
+
+_state_name = ".vad_daemon.json"
+_time_fmt = "%Y%m%d%H%M%S"
+_last_size_re = re.compile(r"([\d]+) [\w]{3} +[\d]{1,2} [\d]{2}:[\d]{2} sn\.last")
+
+
+class DaemonState(object):
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as fstate:
+                self._radars = json.load(fstate)
+        except (IOError, ValueError):
+            self._radars = {}
+
+    def listing(self, radar_id):
+        return self._radars.get(radar_id, {}).get('listing')
+
+    def valid_time(self, radar_id):
+        return self._radars.get(radar_id, {}).get('valid_time')
+
+    def update(self, radar_id, **kwargs):
+        self._radars.setdefault(radar_id, {}).update(kwargs)
+
+    def save(self):
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, 'w') as fstate:
+            json.dump(self._radars, fstate)
+        os.rename(tmp_path, self.path)
+
+
+def _listing_stamp(file_list, file_text):
+    # The time and size of sn.last change when there's a new product. The size catches one replaced within a minute.
+    file_names, file_dts = file_list
+    match = _last_size_re.search(file_text)
+    size = int(match.group(1)) if match is not None else None
+    return [ file_dts[-1].strftime(_time_fmt), size ]
+
+
+def _poll(radar_id, known, pool, cache_path):
+    file_text = pool.listing(listing_url(radar_id))
+    file_list = parse_listing(radar_id, file_text)
+    stamp = _listing_stamp(file_list, file_text)
+    if stamp == known:
+        return stamp, None
+
+    if known is not None and stamp[0] == known[0]:
+        # Only the size changed, so the cache (which goes by the listing time) would hand back the old product.
+        cache_path = None
+
+    # Hand the new listing to download_vad so it doesn't list the directory again to look in the cache.
+    vad = download_vad(radar_id, cache_path=cache_path, pool=pool, file_list=file_list)
+    vad.rid = radar_id
+    return stamp, vad
+
+
+def vad_daemon(radar_ids, storm_motion='right-mover', sfc_wind=None, output='.', cache_path=None, fixed=False,
+               interval=120., spread=None, once=False, state_path=None, download_workers=16, render_workers=None):
+    if spread is None:
+        spread = interval
+    if state_path is None:
+        state_path = os.path.join(output, _state_name)
+
+    state = DaemonState(state_path)
+    # The parameters from each new volume, so each report can say how they've changed over the last hour
+    series = ParameterService(storm_motion=storm_motion)
+
+    # Spread the radars out over the interval so the polls (and the renders) don't all come at once.
+    start = time.time()
+    schedule = [ (start + idx * spread / len(radar_ids), radar_id) for idx, radar_id in enumerate(radar_ids) ]
+
+    with FTPPool(max_per_host=download_workers) as ftp_pool, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=render_workers) as render_pool:
+
+        polls = {}
+        renders = {}
+        busy = set()
+        while schedule or polls or renders:
+            now = time.time()
+            while schedule and schedule[0][0] <= now:
+                due, radar_id = heapq.heappop(schedule)
+                if not once:
+                    heapq.heappush(schedule, (due + interval, radar_id))
+
+                # If the last poll for this radar hasn't finished, skip this one rather than piling them up.
+                if radar_id in busy:
+                    continue
+
+                fut = download_pool.submit(_poll, radar_id, state.listing(radar_id), ftp_pool, cache_path)
+                polls[fut] = radar_id
+                busy.add(radar_id)
+
+            timeout = max(0, schedule[0][0] - now) if schedule else None
+            if not polls and not renders:
+                # wait() returns right away when there's nothing to wait on. The loop's already ended if there's
+                #   nothing scheduled either.
+                time.sleep(timeout)
+                continue
+
+            done, not_done = wait(list(polls) + list(renders), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                if fut in polls:
+                    radar_id = polls.pop(fut)
+                    try:
+                        stamp, vad = fut.result()
+                    except Exception:
+                        busy.discard(radar_id)
+                        report_error(radar_id)
+                        continue
+
+                    if vad is None:
+                        busy.discard(radar_id)
+                        continue
+
+                    valid_time = vad['time'].strftime(_time_fmt)
+                    if valid_time == state.valid_time(radar_id):
+                        # The listing changed, but it's the same volume, so there's nothing new to draw.
+                        busy.discard(radar_id)
+                        state.update(radar_id, listing=stamp)
+                        state.save()
+                        continue
+
+                    series.add(radar_id, vad)
+
+                    # Draw to the side and move it into place, so nobody ever gets half an image.
+                    fname = os.path.join(output, "%s_vad.png" % radar_id)
+                    tmp_fname = os.path.join(output, ".tmp.%s" % os.path.basename(fname))
+                    fut = render_pool.submit(render_vad, vad, storm_motion, sfc_wind, tmp_fname, fixed, False)
+                    renders[fut] = (radar_id, stamp, valid_time, vad['time'], fname, tmp_fname)
+                else:
+                    radar_id, stamp, valid_time, vad_time, fname, tmp_fname = renders.pop(fut)
+                    busy.discard(radar_id)
+                    try:
+                        fut.result()
+                    except Exception:
+                        report_error(radar_id)
+                        continue
+
+                    os.rename(tmp_fname, fname)
+                    state.update(radar_id, listing=stamp, valid_time=valid_time)
+                    state.save()
+                    trends = dict(("%d_min" % mins, dict((name, nullify(val)) for name, val in mins_trends.items()))
+                                  for mins, mins_trends in series.trends(radar_id).items())
+                    report(radar_id, valid_time=vad_time.strftime("%Y-%m-%dT%H:%M:%SZ"), filename=fname, trends=trends)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('radar_ids', nargs='+', help="The 4-character identifiers for the radars (e.g. KTLX KFWS), or 'all' for every WSR-88D and TDWR.")
+    ap.add_argument('-m', '--storm-motion', dest='storm_motion', help="Storm motion vector. Takes the same forms as in vad.py.", default='right-mover')
+    ap.add_argument('-s', '--sfc-wind', dest='sfc_wind', help="Surface wind vector. Takes the form DDD/SS. The same surface wind is used for every radar.")
+    ap.add_argument('-o', '--output', dest='output', default='.', help="Path in which to put the images.")
+    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here.")
+    ap.add_argument('-x', '--fixed-frame', dest='fixed', action='store_true')
+    ap.add_argument('-i', '--interval', dest='interval', type=float, default=120., help="Time between polls of each radar in seconds.")
+    ap.add_argument('-g', '--spread', dest='spread', type=float, help="Time in seconds over which to spread out the polls of the radars. Defaults to the interval; 0 polls every radar at once.")
+    ap.add_argument('-1', '--once', dest='once', action='store_true', help="Poll each radar once and exit (e.g. from cron).")
+    ap.add_argument('-S', '--state', dest='state_path', help="File in which to keep what's been seen of each radar. Defaults to .vad_daemon.json in the output path.")
+    ap.add_argument('-j', '--download-workers', dest='download_workers', type=int, default=16, help="Number of simultaneous downloads.")
+    ap.add_argument('-r', '--render-workers', dest='render_workers', type=int, help="Number of rendering processes. Defaults to the number of CPUs.")
+    args = ap.parse_args()
+
+    if [ rid.lower() for rid in args.radar_ids ] == ['all']:
+        radar_ids = all_radar_ids()
+    else:
+        radar_ids = [ rid.upper() for rid in args.radar_ids ]
+
+    np.seterr(all='ignore')
+
+    # Exit cleanly (closing the FTP connections and the render processes) when asked to stop.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        vad_daemon(radar_ids,
+            storm_motion=args.storm_motion,
+            sfc_wind=args.sfc_wind,
+            output=args.output,
+            cache_path=args.cache_path,
+            fixed=args.fixed,
+            interval=args.interval,
+            spread=args.spread,
+            once=args.once,
+            state_path=args.state_path,
+            download_workers=args.download_workers,
+            render_workers=args.render_workers
+        )
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+from __future__ import print_function
+
+import os
+import struct
+import hashlib
+import tarfile
+import zlib
+import sqlite3
+import threading
+import time as _time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from vad_reader import VADFile
+from vad_archive import is_archive, is_compressed, iter_members, read_members
+from wsr88d import build_has_name, parse_has_name
+
+_index_name = ".vad_index.sqlite"
+_cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser(os.path.join("~", ".cache"))), "vad-plotter")
+_update_interval = 60
+_epoch = datetime(1970, 1, 1, 0, 0, 0)
+
+IndexEntry = namedtuple('IndexEntry', ['radar_id', 'time', 'vcp', 'path', 'offset', 'size'])
+
+
+def _to_seconds(dt):
+    return int((dt - _epoch).total_seconds())
+
+
+def _from_seconds(seconds):
+    return _epoch + timedelta(seconds=seconds)
+
+
+def _default_index_path(root):
+    if os.access(root, os.W_OK):
+        return os.path.join(root, _index_name)
+
+    # Somewhere we can write for an archive we can't (e.g. a read-only mount), named for the archive's path.
+    if not os.path.isdir(_cache_dir):
+        os.makedirs(_cache_dir)
+    return os.path.join(_cache_dir, "index-%s.sqlite" % hashlib.sha1(root.encode('utf-8')).hexdigest()[:16])
+
+
+class VADIndex(object):
+    def __init__(self, root, index_path=None):
+        self._root = os.path.abspath(root)
+        if index_path is None:
+            index_path = _default_index_path(self._root)
+        self._index_path = os.path.abspath(index_path)
+
+        # One index can be shared by the threads of a batch run, so guard the connection with a lock.
+        self._db = sqlite3.connect(self._index_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path  TEXT PRIMARY KEY,
+                size  INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS vwps (
+                radar_id TEXT NOT NULL,
+                time     INTEGER NOT NULL,
+                vcp      INTEGER,
+                path     TEXT NOT NULL REFERENCES files (path),
+                offset   INTEGER NOT NULL,
+                size     INTEGER NOT NULL,
+                PRIMARY KEY (path, offset)
+            );
+            CREATE INDEX IF NOT EXISTS vwps_radar_time ON vwps (radar_id, time);
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        self._db.close()
+
+    def is_stale(self, max_age=_update_interval):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'updated'").fetchone()
+        return row is None or _time.time() - row[0] > max_age
+
+    def refresh(self, max_age=_update_interval):
+        if self.is_stale(max_age):
+            self.update()
+
+    def update(self):
+        with self._lock:
+            self._update()
+
+    def _update(self):
+        started = _time.time()
+        known = dict((path, (size, mtime)) for path, size, mtime in self._db.execute("SELECT path, size, mtime FROM files"))
+        seen = set()
+
+        with self._db:
+            for path in self._walk():
+                rel_path = os.path.relpath(path, self._root)
+                seen.add(rel_path)
+
+                stat = os.stat(path)
+                if known.get(rel_path) == (stat.st_size, stat.st_mtime):
+                    continue
+
+                self._add_file(rel_path, stat)
+
+            for rel_path in set(known) - seen:
+                self._remove_file(rel_path)
+
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('updated', ?)", (started, ))
+
+    def add_file(self, path):
+        path = os.path.abspath(path)
+        with self._lock, self._db:
+            self._add_file(os.path.relpath(path, self._root), os.stat(path))
+
+    def find_before(self, radar_id, time):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM vwps WHERE radar_id = ? AND time <= ? ORDER BY time DESC LIMIT 1",
+                                   (radar_id, _to_seconds(time))).fetchone()
+        return None if row is None else self._make_entry(row)
+
+    def find_range(self, radar_id, start, end):
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM vwps WHERE radar_id = ? AND time >= ? AND time <= ? ORDER BY time",
+                                    (radar_id, _to_seconds(start), _to_seconds(end))).fetchall()
+        return [ self._make_entry(row) for row in rows ]
+
+    def load(self, entry, **kwargs):
+        return self.load_many([ entry ], **kwargs)[0]
+
+    def load_many(self, entries, **kwargs):
+        vads = [ None ] * len(entries)
+        by_path = {}
+        for idx, entry in enumerate(entries):
+            if entry.offset == 0 and entry.size == os.path.getsize(entry.path) and not is_compressed(entry.path):
+                vads[idx] = VADFile.from_path(entry.path, **kwargs)
+            else:
+                by_path.setdefault(entry.path, []).append(idx)
+
+        # Everything from the same archive in one pass, so a compressed archive isn't decompressed once per VWP.
+        for path, idxs in by_path.items():
+            bufs = read_members(path, [ (entries[idx].offset, entries[idx].size) for idx in idxs ])
+            for idx, buf in zip(idxs, bufs):
+                vads[idx] = VADFile.from_buffer(buf, **kwargs)
+        return vads
+
+    def _walk(self):
+        for dir_path, dir_names, file_names in os.walk(self._root):
+            dir_names[:] = sorted(dn for dn in dir_names if not dn.startswith('.'))
+            for fn in sorted(file_names):
+                path = os.path.join(dir_path, fn)
+                if fn.startswith('.') or os.path.abspath(path) == self._index_path:
+                    continue
+                yield path
+
+    def _add_file(self, rel_path, stat):
+        self._remove_file(rel_path)
+        self._db.execute("INSERT INTO files VALUES (?, ?, ?)", (rel_path, stat.st_size, stat.st_mtime))
+
+        path = os.path.join(self._root, rel_path)
+        if is_archive(path):
+            self._add_archive(rel_path)
+            return
+
+        try:
+            radar_id = parse_has_name(os.path.basename(path))[0]
+            vad = VADFile.from_path(path, lazy=True)
+        except (IOError, ValueError, struct.error):
+            # Not a VWP, but keep the file in the table so it isn't looked at again until it changes
+            return
+
+        self._db.execute("INSERT INTO vwps VALUES (?, ?, ?, ?, ?, ?)",
+                         (radar_id, _to_seconds(vad['time']), vad['vcp'], rel_path, 0, stat.st_size))
+
+    def _add_archive(self, rel_path):
+        path = os.path.join(self._root, rel_path)
+        try:
+            for member in iter_members(path):
+                try:
+                    radar_id = parse_has_name(os.path.basename(member.name))[0]
+                    vad = VADFile.from_buffer(member.data, lazy=True)
+                except (IOError, ValueError, struct.error):
+                    continue
+
+                self._db.execute("INSERT OR REPLACE INTO vwps VALUES (?, ?, ?, ?, ?, ?)",
+                                 (radar_id, _to_seconds(vad['time']), vad['vcp'], rel_path, member.offset, member.size))
+        except (IOError, EOFError, zlib.error, tarfile.TarError):
+            # A truncated or corrupt archive. Keep whatever was indexed before the bad spot.
+            return
+
+    def _remove_file(self, rel_path):
+        self._db.execute("DELETE FROM vwps WHERE path = ?", (rel_path, ))
+        self._db.execute("DELETE FROM files WHERE path = ?", (rel_path, ))
+
+    def _make_entry(self, row):
+        radar_id, time, vcp, rel_path, offset, size = row
+        return IndexEntry(radar_id, _from_seconds(time), vcp, os.path.join(self._root, rel_path), offset, size)
+
+
+def load_local_vad(local_path, radar_id, time, index=None, index_path=None):
+    iname = build_has_name(radar_id, time)
+    local_fname = "%s/%s" % (local_path, iname)
+    if os.path.exists(local_fname):
+        return VADFile.from_path(local_fname)
+
+    # No file valid at exactly that minute, so find the latest one before it. A shared index has already been brought
+    #   up to date by whoever opened it; otherwise only walk the tree if it hasn't been walked for a while. A miss
+    #   doesn't count, since asking for a time before the archive starts would walk the tree every time.
+    own_index = index is None
+    if own_index:
+        index = VADIndex(local_path, index_path=index_path)
+    try:
+        if own_index:
+            index.refresh()
+        entry = index.find_before(radar_id, time)
+
+        if entry is None:
+            raise ValueError("No VAD files before %s." % time.strftime("%d %B %Y %H%M UTC"))
+        return index.load(entry)
+    finally:
+        if own_index:
+            index.close()
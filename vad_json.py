@@ -5,19 +5,25 @@ from datetime import datetime, timedelta
 import argparse
 import sys
 
-from vad_reader import download_vad, VADFile
+from vad_reader import download_vad
 from vad import parse_time
-from wsr88d import build_has_name
+from vad_index import load_local_vad
+from vad_store import VADStore
 
-def vad_json(radar_id, vwp_time=None, file_id=None, local_path=None, output='.', gzip=False):
+def vad_json(radar_id, vwp_time=None, file_id=None, local_path=None, output='.', gzip=False, store=None, index_path=None):
     if local_path is None:
         vad = download_vad(radar_id, time=vwp_time, file_id=file_id)
     else:
-        iname = build_has_name(radar_id, vwp_time)
-        vad = VADFile(open("%s/%s" % (local_path, iname), 'rb'))
+        vad = load_local_vad(local_path, radar_id, vwp_time, index_path=index_path)
 
     output_dt = vad['time']
 
+    if store is not None:
+        appended = VADStore(store).append(radar_id, vad)
+        output = {'store': store, 'datetime': output_dt.strftime("%Y-%m-%dT%H:%M:%SZ"), 'appended': appended}
+        print(json.dumps(output))
+        return
+
     vwp = {
         'radar_id': radar_id,
         'datetime': output_dt.strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -43,8 +49,10 @@ def main():
     ap.add_argument('-t', '--time', dest='time', type=parse_time, help="Time to download. Takes the form DD/HHMM, where DD is the day, HH is the hour, and MM is the minute.")
     ap.add_argument('-i', '--file-id', dest='file_id', type=int, help="File id to download (this is the last 4 digits of sn.0250)")
     ap.add_argument('-p', '--local-path', dest='local_path', help="Path to local data. If not given, download from the Internet.")
+    ap.add_argument('-I', '--index-path', dest='index_path', help="File in which to keep the index of the local data. Defaults to the same as in vad.py.")
     ap.add_argument('-o', '--output', dest='output', default='.', help="Path to output JSON")
     ap.add_argument('-z', '--gzip', dest='gzip', action='store_true', help="Flag to gzip output")
+    ap.add_argument('-s', '--store', dest='store', help="Path to a columnar store (see vad_store.py). If given, append the profile to the store instead of writing JSON.")
 
     args = ap.parse_args()
 
@@ -52,7 +60,7 @@ def main():
 
     try:
         vad_json(args.radar_id, vwp_time=args.time, file_id=args.file_id, local_path=args.local_path, 
-            output=args.output, gzip=args.gzip)
+            output=args.output, gzip=args.gzip, store=args.store, index_path=args.index_path)
     except Exception as exc:
         typ, val, trace = sys.exc_info()
         err_str = f"{typ.__name__}: {val}"
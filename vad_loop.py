@@ -0,0 +1,174 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import argparse
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from ftp_pool import FTPPool
+from params import Profile
+from hodo_scene import frame_bounds
+from vad_reader import find_file_times
+from vad import parse_time, load_vad_range
+from vad_index import VADIndex
+from vad_batch import render_vad, report, report_error
+
+_animation_types = ['gif', 'sprite']
+
+
+def loop_bounds(profiles, fixed=False):
+    bounds = np.array([ frame_bounds(prof, fixed=fixed) for prof in profiles ])
+
+    # Union of the frames for every time, squared up so the rings stay round
+    min_u, min_v = bounds[:, 0].min(), bounds[:, 2].min()
+    max_u, max_v = bounds[:, 1].max(), bounds[:, 3].max()
+    ctr_u = (min_u + max_u) / 2
+    ctr_v = (min_v + max_v) / 2
+    size = max(max_u - min_u, max_v - min_v)
+    return ctr_u - size / 2, ctr_u + size / 2, ctr_v - size / 2, ctr_v + size / 2
+
+
+def write_gif(frame_names, fname, duration=500, dwell=3):
+    frames = [ Image.open(frame_name).convert('RGB') for frame_name in frame_names ]
+    durations = [ duration ] * (len(frames) - 1) + [ duration * dwell ]
+    frames[0].save(fname, save_all=True, append_images=frames[1:], duration=durations, loop=0)
+
+
+def write_sprite(frame_names, fname):
+    frames = [ Image.open(frame_name) for frame_name in frame_names ]
+    frame_wid, frame_hght = frames[0].size
+
+    sprite = Image.new('RGBA', (frame_wid * len(frames), frame_hght))
+    for idx, frame in enumerate(frames):
+        sprite.paste(frame, (idx * frame_wid, 0))
+    sprite.save(fname)
+
+
+class VADLoop(object):
+    def __init__(self, radar_id, vads, bounds, frame_names, renders):
+        self.radar_id = radar_id
+        self.vads = vads
+        self.bounds = bounds
+        self.frame_names = frame_names
+        self._renders = renders
+
+    def finish(self, fname, animation='gif', duration=500):
+        for fut in self._renders:
+            fut.result()
+
+        if animation == 'gif':
+            write_gif(self.frame_names, fname, duration=duration)
+        else:
+            write_sprite(self.frame_names, fname)
+
+
+def start_loop(radar_id, render_pool, time=None, length=120, storm_motion='right-mover', sfc_wind=None, output='.',
+               local_path=None, cache_path=None, fixed=False, pool=None, index=None):
+    if time is None:
+        if local_path is not None:
+            raise ValueError("'-t' ('--time') argument is required when loading from the local disk.")
+        time = find_file_times(radar_id, pool=pool)[0][1]
+
+    start = time - timedelta(minutes=length)
+    vads = load_vad_range(radar_id, start, time, local_path=local_path, cache_path=cache_path, pool=pool, index=index)
+    if len(vads) == 0:
+        raise ValueError("No VAD files between %s and %s." % (start.strftime("%d %B %Y %H%M UTC"), time.strftime("%d %B %Y %H%M UTC")))
+
+    # The same bounds for every frame, so the background only gets drawn once per rendering process.
+    bounds = loop_bounds([ Profile(vad) for vad in vads ], fixed=fixed)
+
+    frame_names = []
+    renders = []
+    for vad in vads:
+        frame_name = os.path.join(output, "%s_vad_%s.png" % (radar_id, vad['time'].strftime("%Y%m%d%H%M")))
+        renders.append(render_pool.submit(render_vad, vad, storm_motion, sfc_wind, frame_name, fixed,
+                                          local_path is not None, bounds=bounds))
+        frame_names.append(frame_name)
+
+    return VADLoop(radar_id, vads, bounds, frame_names, renders)
+
+
+def vad_loop(radar_ids, time=None, length=120, storm_motion='right-mover', sfc_wind=None, output='.', local_path=None,
+             cache_path=None, fixed=False, animation='gif', duration=500, render_workers=None, index_path=None):
+    plot_time = None
+    if time:
+        plot_time = parse_time(time)
+
+    index = None
+    if local_path is not None:
+        # One index for the whole run, brought up to date once, rather than every radar walking the tree on its own
+        index = VADIndex(local_path, index_path=index_path)
+        index.update()
+
+    try:
+        with FTPPool() as ftp_pool, ProcessPoolExecutor(max_workers=render_workers) as render_pool:
+            # Load everything up front so the rendering processes stay busy while the next radar downloads.
+            loops = []
+            for radar_id in radar_ids:
+                try:
+                    loop = start_loop(radar_id, render_pool, time=plot_time, length=length, storm_motion=storm_motion,
+                                      sfc_wind=sfc_wind, output=output, local_path=local_path, cache_path=cache_path,
+                                      fixed=fixed, pool=ftp_pool, index=index)
+                except Exception:
+                    report_error(radar_id)
+                    continue
+                loops.append(loop)
+
+            ext = 'gif' if animation == 'gif' else 'png'
+            for loop in loops:
+                fname = os.path.join(output, "%s_vad_loop.%s" % (loop.radar_id, ext))
+                try:
+                    loop.finish(fname, animation=animation, duration=duration)
+                except Exception:
+                    report_error(loop.radar_id)
+                    continue
+
+                min_u, max_u, min_v, max_v = loop.bounds
+                report(loop.radar_id, filename=fname,
+                        valid_times=[ vad['time'].strftime("%Y-%m-%dT%H:%M:%SZ") for vad in loop.vads ],
+                        bounds={'min_u':min_u, 'max_u':max_u, 'min_v':min_v, 'max_v':max_v})
+    finally:
+        if index is not None:
+            index.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('radar_ids', nargs='+', help="The 4-character identifiers for the radars (e.g. KTLX KFWS).")
+    ap.add_argument('-m', '--storm-motion', dest='storm_motion', help="Storm motion vector. Takes the same forms as in vad.py.", default='right-mover')
+    ap.add_argument('-s', '--sfc-wind', dest='sfc_wind', help="Surface wind vector. Takes the form DDD/SS. The same surface wind is used for every frame.")
+    ap.add_argument('-t', '--time', dest='time', help="End time of the loop. Takes the form DD/HHMM, where DD is the day, HH is the hour, and MM is the minute. Defaults to the latest VWP.")
+    ap.add_argument('-l', '--length', dest='length', type=int, default=120, help="Length of the loop in minutes.")
+    ap.add_argument('-o', '--output', dest='output', default='.', help="Path in which to put the frames and the loop.")
+    ap.add_argument('-p', '--local-path', dest='local_path', help="Path to local data. If not given, download from the Internet.")
+    ap.add_argument('-I', '--index-path', dest='index_path', help="File in which to keep the index of the local data. Defaults to the same as in vad.py.")
+    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here.")
+    ap.add_argument('-x', '--fixed-frame', dest='fixed', action='store_true')
+    ap.add_argument('-a', '--animation', dest='animation', choices=_animation_types, default='gif', help="Put the frames in an animated GIF or a sprite sheet (a PNG with the frames side by side).")
+    ap.add_argument('-d', '--duration', dest='duration', type=int, default=500, help="Time each frame is shown in the GIF, in milliseconds. The last frame is shown for three times as long.")
+    ap.add_argument('-r', '--render-workers', dest='render_workers', type=int, help="Number of rendering processes. Defaults to the number of CPUs.")
+    args = ap.parse_args()
+
+    np.seterr(all='ignore')
+
+    vad_loop([ rid.upper() for rid in args.radar_ids ],
+        time=args.time,
+        length=args.length,
+        storm_motion=args.storm_motion,
+        sfc_wind=args.sfc_wind,
+        output=args.output,
+        local_path=args.local_path,
+        index_path=args.index_path,
+        cache_path=args.cache_path,
+        fixed=args.fixed,
+        animation=args.animation,
+        duration=args.duration,
+        render_workers=args.render_workers
+    )
+
+if __name__ == "__main__":
+    main()
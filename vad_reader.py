@@ -2,187 +2,332 @@
 from __future__ import print_function
 import numpy as np
 
+import io
+import zlib
 import struct
+import mmap
+import os
+import json
+import bisect
+import tempfile
+import threading
+import time as _time
+from collections import namedtuple
 from datetime import datetime, timedelta
 
-from wsr88d import build_has_name
+from wsr88d import build_has_name, parse_wmo_header
+from vad_cache import VADCache
 
 try:
     from urllib.request import urlopen, URLError
 except ImportError:
     from urllib2 import urlopen, URLError
 
-try:
-    from io import BytesIO
-except ImportError:
-    from BytesIO import BytesIO
-
 import re
 
 _base_url = "ftp://tgftp.nws.noaa.gov/SL.us008001/DF.of/DC.radar/DS.48vwp/"
 
+_structs = {}
+
+def _get_struct(type_string):
+    try:
+        fmt = _structs[type_string]
+    except KeyError:
+        fmt = _structs[type_string] = struct.Struct(">%s" % type_string)
+    return fmt
+
+
+class _Layout(object):
+    def __init__(self, *fields):
+        self._fields = []
+
+        fmt = ">"
+        idx = 0
+        for name, type_string in fields:
+            count = struct.calcsize(">%s" % type_string) // struct.calcsize(">%s" % type_string[-1])
+            if count == 1:
+                self._fields.append((name, idx))
+            else:
+                self._fields.append((name, slice(idx, idx + count)))
+
+            fmt += type_string
+            idx += count
+
+        self._struct = struct.Struct(fmt)
+        self.size = self._struct.size
+
+    def unpack_from(self, buf, offset=0):
+        values = self._struct.unpack_from(buf, offset)
+        return dict((name, values[idx]) for name, idx in self._fields)
+
+
+_message_header = _Layout(
+    ('message_code',   'h'),
+    ('message_date',   'h'),
+    ('message_time',   'i'),
+    ('message_length', 'i'),
+    ('source_id',      'h'),
+    ('dest_id',        'h'),
+    ('num_blocks',     'h'),
+)
+
+_product_description = _Layout(
+    ('block_separator',     'h'),
+    ('radar_latitude',      'i'),
+    ('radar_longitude',     'i'),
+    ('radar_elevation',     'h'),
+    ('product_code',        'h'),
+    ('operational_mode',    'h'),
+    ('vcp',                 'h'),
+    ('req_sequence_number', 'h'),
+    ('vol_sequence_number', 'h'),
+    ('scan_date',           'h'),
+    ('scan_time',           'i'),
+    ('product_date',        'h'),
+    ('product_time',        'i'),
+    ('product_dep_1',       'h'),   # Product-dependent variable 1 (unused)
+    ('product_dep_2',       'h'),   # Product-dependent variable 2 (unused)
+    ('elevation',           'h'),   # Elevation (unused)
+    ('product_dep_3',       'h'),   # Product-dependent variable 3 (unused)
+    ('thresholds',          '16h'), # Product-dependent thresholds (how do I interpret these?)
+    ('product_dep_4_10',    '7h'),  # Product-dependent variables 4-10 (mostly unused ... do I need the max?)
+    ('version',             'b'),
+    ('spot_blank',          'b'),
+    ('offset_symbology',    'i'),
+    ('offset_graphic',      'i'),
+    ('offset_tabular',      'i'),
+)
+
+_symbology_header = _Layout(
+    ('block_separator', 'h'),
+    ('block_id',        'h'),
+    ('block_length',    'i'),
+    ('num_layers',      'h'),
+    ('layer_separator', 'h'),
+    ('layer_num_bytes', 'i'),
+)
+
+_tabular_header = _Layout(
+    ('block_separator', 'h'),
+    ('block_id',        'h'),
+    ('block_size',      'i'),
+)
+
+
+# The WMO heading (e.g. "SDUS34 KOUN 202000", maybe with a BBB group on the end) and the AWIPS ID (e.g. "NVWTLX")
+_wmo_header_re = re.compile(br"([A-Z]{4}[0-9]{2}) ([A-Z0-9]{4}) ([0-9]{6})(?: [A-Z]{3})?\r\r\n([A-Z0-9 ]{4,6})\r\r\n")
+_wmo_max_size = 40
+
+_barb_dtype = np.dtype([('value', 'i2'), ('x', 'i2'), ('y', 'i2'), ('wind_dir', 'i2'), ('wind_spd', 'i2')])
+_text_dtype = np.dtype([('value', 'i2'), ('i', 'i2'), ('j', 'i2'), ('text', object)])
+
+# Bytes after the length field in a wind barb (4) or text (8) packet, not counting the characters
+_packet_min_sizes = {4: 10, 8: 6}
+
+# Character spans of the DIR, SPD, RMS, DIV, SRNG, and ELEV columns in the VAD Algorithm Output table. The values are
+#   right-justified, so the edges only have to fall somewhere in the blanks between them.
+_vad_columns = [ (24, 30), (30, 36), (36, 42), (42, 48), (48, 55), (55, 61) ]
+
+
 class VADFile(object):
     fields = ['wind_dir', 'wind_spd', 'rms_error', 'divergence', 'slant_range', 'elev_angle']
 
-    def __init__(self, file):
-        self._rpg = file
+    def __init__(self, file, tabular_only=False, lazy=False):
+        self._parse(file.read(), tabular_only=tabular_only, lazy=lazy)
+
+    @classmethod
+    def from_buffer(cls, buf, tabular_only=False, lazy=False):
+        vad = cls.__new__(cls)
+        vad._parse(buf, tabular_only=tabular_only, lazy=lazy)
+        return vad
+
+    @classmethod
+    def from_path(cls, path, tabular_only=False, lazy=False):
+        vad = cls.__new__(cls)
+
+        if lazy:
+            # Only the headers are needed up front, so don't bother mapping the whole file.
+            with open(path, 'rb') as fvad:
+                vad._parse(fvad.read(_header_size), tabular_only=tabular_only, lazy=True)
+            vad._source = None
+            vad._source_path = path
+        else:
+            buf = _map_file(path)
+            try:
+                vad._parse(buf, tabular_only=tabular_only)
+            finally:
+                buf.close()
+        return vad
+
+    def _parse(self, buf, tabular_only=False, lazy=False):
         self._data = None
+        self._wind_barbs = None
+        self._text_packets = None
+        self._tabular_only = tabular_only
+        self._source = None
+        self._source_path = None
 
-        self._read_headers()
-        has_symbology_block, has_graphic_block, has_tabular_block = self._read_product_description_block()
+        self._read_buffer(buf, self._read_header_blocks)
 
-        if has_symbology_block:
-            self._read_product_symbology_block()
+        if lazy:
+            self._source = buf
+        else:
+            self._read_buffer(buf, self._read_data_blocks)
+            self._data = self._get_data()
+        return
 
-        if has_graphic_block:
-            pass
+    def _load(self):
+        if self._source is None and self._source_path is None:
+            return
 
-        if has_tabular_block:
-            self._read_tabular_block()
+        if self._source_path is not None:
+            buf = _map_file(self._source_path)
+            try:
+                self._read_buffer(buf, self._read_data_blocks)
+            finally:
+                buf.close()
+        else:
+            self._read_buffer(self._source, self._read_data_blocks)
 
+        self._source = None
+        self._source_path = None
         self._data = self._get_data()
-        return
 
-    def _read_headers(self):
-        wmo_header = self._read('s30')
+    def _read_buffer(self, buf, reader):
+        self._rpg = memoryview(buf)
+        self._pos = 0
 
-        message_code = self._read('h')
-        message_date = self._read('h')
-        message_time = self._read('i')
-        message_length = self._read('i')
-        source_id = self._read('h')
-        dest_id = self._read('h')
-        num_blocks = self._read('h')
+        try:
+            reader()
+        finally:
+            # Don't hold on to the caller's buffer (or keep a memory map from being closed)
+            self._rpg.release()
+            self._rpg = None
 
-        return
+    def _read_header_blocks(self):
+        self._read_headers()
+        self._block_offsets = self._read_product_description_block()
 
-    def _read_product_description_block(self):
-        self._read('h') # Block separator
-        self._radar_latitude  = self._read('i') / 1000.
-        self._radar_longitude = self._read('i') / 1000.
-        self._radar_elevation = self._read('h')
+    def _read_data_blocks(self):
+        offset_symbology, offset_graphic, offset_tabular = self._block_offsets
 
-        product_code = self._read('h')
-        if product_code != 48:
-            raise IOError("This isn't a VWP file.")
+        if offset_symbology > 0 and not self._tabular_only:
+            self._seek_block(offset_symbology)
+            self._read_product_symbology_block()
 
-        operational_mode    = self._read('h')
-        self._vcp           = self._read('h')
-        req_sequence_number = self._read('h')
-        vol_sequence_number = self._read('h')
+        if offset_graphic > 0:
+            pass
 
-        scan_date    = self._read('h')
-        scan_time    = self._read('i')
-        product_date = self._read('h')
-        product_time = self._read('i')
+        if offset_tabular > 0:
+            self._seek_block(offset_tabular)
+            self._read_tabular_block()
 
-        self._read('h')   # Product-dependent variable 1 (unused)
-        self._read('h')   # Product-dependent variable 2 (unused)
-        self._read('h')   # Elevation (unused)
-        self._read('h')   # Product-dependent variable 3 (unused)
-        self._read('16h') # Product-dependent thresholds (how do I interpret these?)
-        self._read('7h')  # Product-dependent variables 4-10 (mostly unused ... do I need the max?)
+    def _read_headers(self):
+        wmo_match = _wmo_header_re.match(bytes(self._rpg[:_wmo_max_size]))
+        self._pos = 30 if wmo_match is None else wmo_match.end()
+        self._message_start = self._pos
+        message_header = self._read_layout(_message_header)
+        return
+
+    def _read_product_description_block(self):
+        pdb = self._read_layout(_product_description)
 
-        version    = self._read('b')
-        spot_blank = self._read('b')
+        self._radar_latitude  = pdb['radar_latitude'] / 1000.
+        self._radar_longitude = pdb['radar_longitude'] / 1000.
+        self._radar_elevation = pdb['radar_elevation']
 
-        offset_symbology = self._read('i')
-        offset_graphic   = self._read('i')
-        offset_tabular   = self._read('i')
+        if pdb['product_code'] != 48:
+            raise IOError("This isn't a VWP file.")
 
-        self._time = datetime(1969, 12, 31, 0, 0, 0) + timedelta(days=scan_date, seconds=scan_time)
+        self._vcp = pdb['vcp']
+        self._time = datetime(1969, 12, 31, 0, 0, 0) + timedelta(days=pdb['scan_date'], seconds=pdb['scan_time'])
 
-        return offset_symbology > 0, offset_graphic > 0, offset_tabular > 0
+        return pdb['offset_symbology'], pdb['offset_graphic'], pdb['offset_tabular']
+
+    def _seek_block(self, offset):
+        # Block offsets are in halfwords from the start of the message header
+        self._pos = self._message_start + offset * struct.calcsize('h')
 
     def _read_product_symbology_block(self):
-        self._read('h') # Block separator
-        block_id = self._read('h')
+        header = self._read_layout(_symbology_header)
 
-        if block_id != 1:
+        if header['block_id'] != 1:
             raise IOError("This isn't the product symbology block.")
 
-        block_length    = self._read('i')
-        num_layers      = self._read('h')
-        layer_separator = self._read('h')
-        layer_num_bytes = self._read('i')
-        block_data      = self._read('%dh' % int(layer_num_bytes / struct.calcsize('h')))
-
-        packet_code = -1
-        packet_size = -1
-        packet_counter = -1
-        packet_value = -1
-        packet = []
-        for item in block_data:
-            if packet_code == -1:
-                packet_code = item
-            elif packet_size == -1:
-                packet_size = item
-                packet_counter = 0
-            elif packet_value == -1:
-                packet_value = item
-                packet_counter += struct.calcsize('h')
+        text_packets = []
+        wind_barbs = []
+        for ilyr in range(header['num_layers']):
+            if ilyr == 0:
+                layer_num_bytes = header['layer_num_bytes']
             else:
-                packet.append(item)
-                packet_counter += struct.calcsize('h')
-
-                if packet_counter == packet_size:
-                    if packet_code == 8:
-                        str_data = struct.pack('>%dh' % int(packet_size / struct.calcsize('h') - 3), *packet[2:])
-                    elif packet_code == 4:
-                        pass
-
-                    packet = []
-                    packet_code = -1
-                    packet_size = -1
-                    packet_counter = -1
-                    packet_value = -1
+                self._read('h') # Layer separator
+                layer_num_bytes = self._read('i')
+
+            text, barbs = self._read_symbology_layer(layer_num_bytes)
+            text_packets.append(text)
+            wind_barbs.append(barbs)
+
+        self._text_packets = np.concatenate(text_packets) if text_packets else np.empty(0, dtype=_text_dtype)
+        self._wind_barbs = np.concatenate(wind_barbs) if wind_barbs else np.empty(0, dtype=_barb_dtype)
         return
 
+    def _read_symbology_layer(self, layer_num_bytes):
+        layer_start = self._pos
+        layer_words = np.frombuffer(self._rpg, dtype='>i2', count=layer_num_bytes // 2, offset=layer_start)
+
+        try:
+            # Every packet starts with its code and the number of bytes that follow the length field, so jump from 
+            #   header to header rather than walking the packet contents.
+            packet_starts = []
+            idx = 0
+            while idx < len(layer_words) - 1:
+                packet_code, packet_size = layer_words[idx], layer_words[idx + 1]
+                if packet_size <= 0:
+                    raise IOError("Bad packet in the product symbology block.")
+                if idx + 2 + packet_size // 2 > len(layer_words) or packet_size < _packet_min_sizes.get(packet_code, 0):
+                    raise IOError("Truncated symbology packet")
+
+                packet_starts.append(idx)
+                idx += 2 + packet_size // 2
+
+            packet_starts = np.array(packet_starts, dtype=int)
+            packet_codes = layer_words[packet_starts]
+
+            # Packet 4 is a wind barb: value, x, y, direction, speed
+            barb_starts = packet_starts[packet_codes == 4]
+            barb_words = layer_words[barb_starts[:, np.newaxis] + np.arange(2, 7)]
+
+            wind_barbs = np.empty(len(barb_starts), dtype=_barb_dtype)
+            for idx, name in enumerate(wind_barbs.dtype.names):
+                wind_barbs[name] = barb_words[:, idx]
+
+            # Packet 8 is a text string: value, i, j, characters
+            text_starts = packet_starts[packet_codes == 8]
+            text_words = layer_words[text_starts[:, np.newaxis] + np.arange(1, 5)]
+
+            text_packets = np.empty(len(text_starts), dtype=_text_dtype)
+            text_packets['value'] = text_words[:, 1]
+            text_packets['i'] = text_words[:, 2]
+            text_packets['j'] = text_words[:, 3]
+            for idx, (start, size) in enumerate(zip(text_starts, text_words[:, 0])):
+                str_start = layer_start + (start + 5) * 2
+                str_end = str_start + size - 6
+                text_packets['text'][idx] = bytes(self._rpg[str_start:str_end]).decode('utf-8')
+        finally:
+            # Views of the buffer have to be gone before it can be released
+            del layer_words
+
+        self._pos = layer_start + layer_num_bytes
+        return text_packets, wind_barbs
+
     def _read_tabular_block(self):
-        self._read('h')
-        block_id = self._read('h')
-        if block_id != 3:
+        header = self._read_layout(_tabular_header)
+        if header['block_id'] != 3:
             raise IOError("This isn't the tabular block.")
 
-        block_size = self._read('i')
-
-        self._read('h')
-        self._read('h')
-        self._read('i')
-        self._read('i')
-        self._read('h')
-        self._read('h')
-        self._read('h')
-
-        self._read('h')
-        self._read('i')
-        self._read('i')
-        self._read('h')
-        product_code = self._read('h')
-
-        operational_mode    = self._read('h')
-        vcp                 = self._read('h')
-        req_sequence_number = self._read('h')
-        vol_sequence_number = self._read('h')
-
-        scan_date    = self._read('h')
-        scan_time    = self._read('i')
-        product_date = self._read('h')
-        product_time = self._read('i')
-
-        self._read('h')   # Product-dependent variable 1 (unused)
-        self._read('h')   # Product-dependent variable 2 (unused)
-        self._read('h')   # Elevation (unused)
-        self._read('h')   # Product-dependent variable 3 (unused)
-        self._read('16h') # Product-dependent thresholds (how do I interpret these?)
-        self._read('7h')  # Product-dependent variables 4-10 (mostly unused ... do I need the max?)
-
-        version    = self._read('b')
-        spot_blank = self._read('b')
-
-        offset_symbology = self._read('i')
-        offset_graphic   = self._read('i')
-        offset_tabular   = self._read('i')
+        # The tabular block repeats the message header and product description block
+        self._read_layout(_message_header)
+        self._read_layout(_product_description)
 
         self._read('h') # Block separator
         num_pages = self._read('h')
@@ -196,13 +341,20 @@ class VADFile(object):
 
         return
 
+    def _read_layout(self, layout):
+        data = layout.unpack_from(self._rpg, self._pos)
+        self._pos += layout.size
+        return data
+
     def _read(self, type_string):
         if type_string[0] != 's':
-            size = struct.calcsize(type_string)
-            data = struct.unpack(">%s" % type_string, self._rpg.read(size))
+            fmt = _get_struct(type_string)
+            data = fmt.unpack_from(self._rpg, self._pos)
+            self._pos += fmt.size
         else:
             size = int(type_string[1:])
-            data = tuple([ self._rpg.read(size).strip(b"\0").decode('utf-8') ])
+            data = tuple([ bytes(self._rpg[self._pos:(self._pos + size)]).strip(b"\0").decode('utf-8') ])
+            self._pos += size
 
         if len(data) == 1:
             return data[0]
@@ -215,109 +367,458 @@ class VADFile(object):
             if (page[0].strip())[:20] == "VAD Algorithm Output":
                 vad_list.extend(page[3:])
 
-        data = dict((k, []) for k in VADFile.fields)
-
-        for line in vad_list:
-            values = line.strip().split()
-            data['wind_dir'].append(float(values[4]))
-            data['wind_spd'].append(float(values[5]))
-            data['rms_error'].append(float(values[6]))
-            data['divergence'].append(float(values[7]) if values[7] != 'NA' else np.nan)
-            data['slant_range'].append(float(values[8]))
-            data['elev_angle'].append(float(values[9]))
-
-        for key, val in data.items():
-            data[key] = np.array(val)
-
+        if len(vad_list) == 0:
+            return np.empty(0, dtype=_data_dtype)
+
+        # Decode the whole table in one pass by cutting the fixed-width columns out of an array of characters.
+        num_rows = len(vad_list)
+        chars = np.array(vad_list, dtype='U%d' % _vad_columns[-1][1]).view('U1').reshape((num_rows, -1))
+
+        table = np.empty((num_rows, len(VADFile.fields)))
+        good = np.ones(num_rows, dtype=bool)
+        for idx, (start, end) in enumerate(_vad_columns):
+            column = np.char.strip(np.ascontiguousarray(chars[:, start:end]).view('U%d' % (end - start))[:, 0])
+            column[column == 'NA'] = 'nan'
+            try:
+                table[:, idx] = column.astype(float)
+            except ValueError:
+                # A garbled row somewhere. Go through this column a value at a time and drop the rows that don't decode.
+                for row, value in enumerate(column):
+                    try:
+                        table[row, idx] = float(value)
+                    except ValueError:
+                        good[row] = False
+
+        table = table[good]
+        data = np.empty(len(table), dtype=_data_dtype)
+        data.view(np.float64).reshape((len(table), len(_data_dtype.names)))[:, :len(VADFile.fields)] = table
 
         data['slant_range'] *= 6067.1 / 3281.
 
         r_e = 4. / 3. * 6371
         data['altitude'] = np.sqrt(r_e ** 2 + data['slant_range'] ** 2 + 2 * r_e * data['slant_range'] * np.sin(np.radians(data['elev_angle']))) - r_e
 
-        order = np.argsort(data['altitude'])
-        for key, val in data.items():
-            data[key] = val[order]
-        return data
+        return data[np.argsort(data['altitude'])]
 
     def __getitem__(self, key):
+        if key not in ['time', 'vcp']:
+            self._load()
+
         if key == 'time':
             val = self._time
+        elif key == 'vcp':
+            val = self._vcp
+        elif key == 'wind_barbs':
+            val = self._wind_barbs
+        elif key == 'text_packets':
+            val = self._text_packets
         else:
             val = self._data[key]
         return val
 
     def add_surface_wind(self, sfc_wind):
         sfc_dir, sfc_spd = sfc_wind
+        self._load()
+
+        sfc = np.empty(1, dtype=_data_dtype)
+        sfc.view(np.float64)[:] = np.nan
 
         keys = ['wind_dir', 'wind_spd', 'rms_error', 'altitude']
         vals = [float(sfc_dir), float(sfc_spd), 0., 0.01]
 
         for key, val in zip(keys, vals):
-            self._data[key] = np.append(val, self._data[key])
+            sfc[key] = val
+
+        self._data = np.concatenate((sfc, self._data))
+
+
+_data_dtype = np.dtype([(key, np.float64) for key in VADFile.fields + ['altitude']])
+_header_size = _wmo_max_size + _message_header.size + _product_description.size
+
+
+def _map_file(path):
+    with open(path, 'rb') as fvad:
+        try:
+            return mmap.mmap(fvad.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files
+            raise IOError("This isn't a VWP file.")
+
+NIDSProduct = namedtuple('NIDSProduct', ['offset', 'wmo_header', 'awips_id', 'product_code', 'data'])
+
+_zlib_magic = [ b"\x78\x01", b"\x78\x5e", b"\x78\x9c", b"\x78\xda" ]
+_max_message_size = 1 << 24
+
+
+class _StreamBuffer(object):
+    def __init__(self, stream, chunk_size):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self.buf = bytearray()
+        self.start = 0  # Offset in the stream of the start of the buffer
+        self.eof = False
+
+    def fill(self, end):
+        # Read until the buffer runs to (stream) offset end. Returns False if the stream runs out first.
+        while self.start + len(self.buf) < end and not self.eof:
+            chunk = self._stream.read(max(self._chunk_size, end - self.start - len(self.buf)))
+            if not chunk:
+                self.eof = True
+            self.buf.extend(chunk)
+        return self.start + len(self.buf) >= end
+
+    def read_more(self):
+        return self.fill(self.start + len(self.buf) + 1)
+
+    def discard(self, end):
+        # Throw away everything before (stream) offset end, reading and throwing away more if need be.
+        while self.start + len(self.buf) < end and not self.eof:
+            self.start += len(self.buf)
+            del self.buf[:]
+            self.read_more()
+
+        drop = min(end - self.start, len(self.buf))
+        del self.buf[:drop]
+        self.start += drop
+
+    def get(self, start, end):
+        return bytes(self.buf[(start - self.start):(end - self.start)])
+
+
+def _decompress(sbuf, offset):
+    # Products on NOAAPort come zlib-compressed in one or more streams back to back after the WMO heading.
+    data = []
+    while sbuf.fill(offset + 2) and sbuf.get(offset, offset + 2) in _zlib_magic:
+        decomp = zlib.decompressobj()
+        while not decomp.eof:
+            if not sbuf.fill(offset + 1):
+                raise zlib.error("Compressed product ends early.")
+            chunk = sbuf.get(offset, sbuf.start + len(sbuf.buf))
+            data.append(decomp.decompress(chunk))
+            offset += len(chunk) - len(decomp.unused_data)
+    return b"".join(data), offset
+
+
+def split_products(stream, product_codes=(48, ), chunk_size=1 << 16):
+    sbuf = _StreamBuffer(stream, chunk_size)
+
+    while True:
+        wmo_match = _wmo_header_re.search(sbuf.buf)
+        if wmo_match is None:
+            if sbuf.eof:
+                return
+
+            # Keep enough for a heading that's been cut in two by the read.
+            sbuf.discard(sbuf.start + max(0, len(sbuf.buf) - _wmo_max_size))
+            sbuf.read_more()
+            continue
+
+        prod_start = sbuf.start + wmo_match.start()
+        msg_start = sbuf.start + wmo_match.end()
+        wmo_header = b" ".join(wmo_match.groups()[:3]).decode('ascii')
+        awips_id = wmo_match.group(4).decode('ascii').strip()
+        sbuf.discard(prod_start)
+
+        if not sbuf.fill(msg_start + _message_header.size):
+            return
+
+        if sbuf.get(msg_start, msg_start + 2) in _zlib_magic:
+            try:
+                data, msg_end = _decompress(sbuf, msg_start)
+            except zlib.error:
+                sbuf.discard(prod_start + 1)
+                continue
+
+            if _wmo_header_re.match(data[:_wmo_max_size]) is None:
+                data = sbuf.get(prod_start, msg_start) + data
+
+            for product in split_products(io.BytesIO(data), product_codes=product_codes):
+                yield product._replace(offset=prod_start)
+            sbuf.discard(msg_end)
+            continue
+
+        header = _message_header.unpack_from(sbuf.get(msg_start, msg_start + _message_header.size))
+        msg_end = msg_start + header['message_length']
+        if not (0 < header['message_code'] < 1000 and _message_header.size <= header['message_length'] <= _max_message_size):
+            # Not really the start of a product. Pick up the search after it.
+            sbuf.discard(prod_start + 1)
+            continue
+
+        # A product cut short on the way in still claims its full length, so if the next heading turns up before the
+        #   end, drop the short one and pick up from there instead of skipping over whatever follows.
+        complete = sbuf.fill(msg_end)
+        sbuf.fill(msg_end + _wmo_max_size)
+        next_match = _wmo_header_re.search(sbuf.buf, msg_start - sbuf.start, msg_end + _wmo_max_size - sbuf.start)
+        if next_match is not None and sbuf.start + next_match.start() < msg_end:
+            sbuf.discard(sbuf.start + next_match.start())
+            continue
+
+        if not complete:
+            return
+
+        if header['message_code'] not in product_codes:
+            sbuf.discard(msg_end)
+            continue
+
+        yield NIDSProduct(prod_start, wmo_header, awips_id, header['message_code'], sbuf.get(prod_start, msg_end))
+        sbuf.discard(msg_end)
+
+
+def read_vad_stream(stream, tabular_only=False, chunk_size=1 << 16):
+    for product in split_products(stream, product_codes=(48, ), chunk_size=chunk_size):
+        try:
+            vad = VADFile.from_buffer(product.data, tabular_only=tabular_only)
+        except (IOError, ValueError, struct.error):
+            # A product that got mangled on the way in. There'll be another in five minutes.
+            continue
+
+        try:
+            vad.rid = parse_wmo_header(product.wmo_header.split()[1], product.awips_id)
+        except ValueError:
+            vad.rid = None
+        yield vad
+
+
+_listing_re = re.compile(r"([\w]{3}) ([\d]{1,2}) ([\d]{2}):([\d]{2}) (sn.[\d]{4})")
+_months = dict((mon, idx + 1) for idx, mon in enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']))
+
+
+class ListingCache(object):
+    def __init__(self, ttl=60, cache_path=None):
+        self.ttl = ttl
+        self._cache_path = cache_path
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def get(self, rid):
+        rid = rid.lower()
+        with self._lock:
+            listing = self._listings.get(rid)
+
+        if listing is None and self._cache_path is not None:
+            listing = self._read(rid)
+
+        if listing is None or _time.time() - listing[0] > self.ttl:
+            return None
+        return listing[1]
+
+    def put(self, rid, file_list):
+        rid = rid.lower()
+        listing = (_time.time(), file_list)
+        with self._lock:
+            self._listings[rid] = listing
+
+        if self._cache_path is not None:
+            self._write(rid, listing)
+
+    def invalidate(self, rid=None):
+        with self._lock:
+            if rid is None:
+                rids = list(self._listings.keys())
+                self._listings.clear()
+            else:
+                rids = [ rid.lower() ]
+                self._listings.pop(rid.lower(), None)
+
+        if self._cache_path is not None:
+            if rid is None:
+                rids = [ fn[9:-5] for fn in os.listdir(self._cache_path) if fn.startswith('.listing.') ]
 
-def find_file_times(rid):
-    url = "%s/SI.%s/" % (_base_url, rid.lower())
+            for rid in rids:
+                try:
+                    os.remove(self._listing_name(rid))
+                except OSError:
+                    pass
 
-    file_text = urlopen(url).read().decode('utf-8')
-    file_list = re.findall("([\w]{3} [\d]{1,2} [\d]{2}:[\d]{2}) (sn.[\d]{4})", file_text)
-    file_times, file_names = list(zip(*file_list))
-    file_names = list(file_names)
+    def _listing_name(self, rid):
+        return "%s/.listing.%s.json" % (self._cache_path, rid)
 
-    year = datetime.utcnow().year
+    def _read(self, rid):
+        try:
+            with open(self._listing_name(rid)) as flst:
+                listing = json.load(flst)
+        except (IOError, ValueError):
+            return None
+
+        file_names = listing['file_names']
+        file_dts = [ datetime.strptime(ft, "%Y%m%d%H%M") for ft in listing['file_times'] ]
+        return listing['fetched'], (file_names, file_dts)
+
+    def _write(self, rid, listing):
+        fetched, (file_names, file_dts) = listing
+        listing = {
+            'fetched': fetched,
+            'file_names': file_names,
+            'file_times': [ ft.strftime("%Y%m%d%H%M") for ft in file_dts ],
+        }
+
+        # Write to a temporary file and move it into place so other processes never see a partial listing.
+        fd, tmp_name = tempfile.mkstemp(dir=self._cache_path, prefix='.tmp.')
+        with os.fdopen(fd, 'w') as flst:
+            json.dump(listing, flst)
+        os.rename(tmp_name, self._listing_name(rid))
+
+
+default_listing_cache = ListingCache()
+
+
+def _read_url(url, pool=None):
+    if pool is None:
+        return urlopen(url).read()
+    return pool.fetch(url)
+
+
+def listing_url(rid, base_url=None):
+    return "%s/SI.%s/" % (base_url or _base_url, rid.lower())
+
+
+def file_url(rid, file_name, base_url=None):
+    return "%s/SI.%s/%s" % (base_url or _base_url, rid.lower(), file_name)
+
+
+def _fetch_file_times(rid, pool=None, base_url=None):
+    url = listing_url(rid, base_url=base_url)
+
+    if pool is None:
+        file_text = urlopen(url).read().decode('utf-8')
+    else:
+        file_text = pool.listing(url)
+    return parse_listing(rid, file_text)
+
+
+def parse_listing(rid, file_text):
+    file_list = _listing_re.findall(file_text)
+    if len(file_list) == 0:
+        raise ValueError("Could not find radar site '%s'" % rid.upper())
+
+    now = datetime.utcnow()
+    file_names = []
     file_dts = []
-    for ft in file_times:
-        ft_dt = datetime.strptime("%d %s" % (year, ft), "%Y %b %d %H:%M")
-        if ft_dt > datetime.utcnow():
-            ft_dt = datetime.strptime("%d %s" % (year - 1, ft), "%Y %b %d %H:%M")
+    for mon, day, hour, minute, fn in file_list:
+        ft_dt = datetime(now.year, _months[mon], int(day), int(hour), int(minute))
+        if ft_dt > now:
+            ft_dt = ft_dt.replace(year=now.year - 1)
 
+        file_names.append(fn)
         file_dts.append(ft_dt)
 
-    file_list = list(zip(file_names, file_dts))
-    file_list.sort(key=lambda fl: fl[1])
-
-    file_names, file_dts = list(zip(*file_list))
-    file_names = list(file_names)
+    order = sorted(range(len(file_dts)), key=lambda idx: file_dts[idx])
+    file_names = [ file_names[idx] for idx in order ]
+    file_dts = [ file_dts[idx] for idx in order ]
 
     # The files are only moved into place when the next one is generated, so shift the
     # file names by one index to account for that.
     file_names[:-1] = file_names[1:]
     file_names[-1] = 'sn.last'
 
+    return file_names, file_dts
+
+
+def _get_file_times(rid, listing_cache=None, pool=None, base_url=None):
+    if listing_cache is None:
+        listing_cache = default_listing_cache
+
+    file_list = listing_cache.get(rid)
+    if file_list is None:
+        file_list = _fetch_file_times(rid, pool=pool, base_url=base_url)
+        listing_cache.put(rid, file_list)
+    return file_list
+
+
+def file_before(file_list, time):
+    file_names, file_dts = file_list
+
+    idx = bisect.bisect_right(file_dts, time) - 1
+    if idx < 0:
+        raise ValueError("No VAD files before %s." % time.strftime("%d %B %Y %H%M UTC"))
+    return file_names[idx], file_dts[idx]
+
+
+def find_file_times(rid, listing_cache=None, pool=None, base_url=None):
+    file_names, file_dts = _get_file_times(rid, listing_cache=listing_cache, pool=pool, base_url=base_url)
     return list(zip(file_names, file_dts))[::-1]
 
-  
-def download_vad(rid, time=None, file_id=None, cache_path=None):
-    if time is None:
-        if file_id is None:
-            url = "%s/SI.%s/sn.last" % (_base_url, rid.lower())
-        else:
-            url = "%s/SI.%s/sn.%04d" % (_base_url, rid.lower(), file_id)
-    else:
-        file_name = ""
-        for fn, ft in find_file_times(rid):
-            if ft <= time:
-                file_name = fn
-                break
 
-        if file_name == "":
-            raise ValueError("No VAD files before %s." % time.strftime("%d %B %Y %H%M UTC"))
+def find_file_before(rid, time, listing_cache=None, pool=None, base_url=None):
+    return file_before(_get_file_times(rid, listing_cache=listing_cache, pool=pool, base_url=base_url), time)
 
-        url = "%s/SI.%s/%s" % (_base_url, rid.lower(), file_name)
 
-    try:
-        frem = urlopen(url)
-    except URLError:
-        raise ValueError("Could not find radar site '%s'" % rid.upper())
+# The steps of download_vad, which vad_async puts together the same way around its own downloads.
+def open_cache(cache_path, listing_cache):
+    cache = None
+    if cache_path is not None:
+        cache = cache_path if isinstance(cache_path, VADCache) else VADCache(cache_path)
+        if listing_cache is None:
+            listing_cache = ListingCache(ttl=default_listing_cache.ttl, cache_path=cache.cache_path)
+    return cache, listing_cache
 
-    if cache_path is None:
-        vad = VADFile(frem)
+
+def needs_listing(time, cache):
+    # Need the listing time to tell which product a name refers to right now, but only if there's a cache to look in.
+    return time is not None or cache is not None
+
+
+def select_file(file_list, time=None, file_id=None):
+    if time is not None:
+        return file_before(file_list, time)
+
+    if file_id is None:
+        file_name = "sn.last"
     else:
-        bio = BytesIO(frem.read())
-        vad = VADFile(bio)
+        file_name = "sn.%04d" % file_id
+
+    file_dt = None
+    if file_list is not None:
+        file_names, file_dts = file_list
+        if file_name in file_names:
+            file_dt = file_dts[file_names.index(file_name)]
+    return file_name, file_dt
+
 
-        iname = build_has_name(rid, vad['time'])
-        with open("%s/%s" % (cache_path, iname), 'wb') as floc:
-            floc.write(bio.getvalue())
+def file_cache_key(rid, file_name, file_dt, cache):
+    if cache is None or file_dt is None:
+        return None
+    return "%s.%s.%s" % (rid.lower(), file_name, file_dt.strftime("%Y%m%d%H%M"))
 
+
+def download_failed(rid, file_dt, listing_cache):
+    if file_dt is not None:
+        # The listing is probably out of date
+        (listing_cache or default_listing_cache).invalidate(rid)
+    raise ValueError("Could not find radar site '%s'" % rid.upper())
+
+
+def finish_download(rid, data, file_dt, cache, cache_key, listing_cache):
+    vad = VADFile.from_buffer(data, lazy=True)
+
+    if cache is not None:
+        if cache_key is not None and vad['time'] > file_dt:
+            # The file has been replaced since the listing was made, so it can't be looked up by this key.
+            listing_cache.invalidate(rid)
+            cache_key = None
+
+        cache.put(cache_key, build_has_name(rid, vad['time']), data)
     return vad
+
+
+def download_vad(rid, time=None, file_id=None, cache_path=None, listing_cache=None, pool=None, base_url=None,
+                 file_list=None):
+    cache, listing_cache = open_cache(cache_path, listing_cache)
+
+    if file_list is None and needs_listing(time, cache):
+        file_list = _get_file_times(rid, listing_cache=listing_cache, pool=pool, base_url=base_url)
+    file_name, file_dt = select_file(file_list, time=time, file_id=file_id)
+
+    cache_key = file_cache_key(rid, file_name, file_dt, cache)
+    if cache_key is not None:
+        data = cache.get(cache_key)
+        if data is not None:
+            return VADFile.from_buffer(data, lazy=True)
+
+    try:
+        data = _read_url(file_url(rid, file_name, base_url=base_url), pool=pool)
+    except URLError:
+        download_failed(rid, file_dt, listing_cache)
+
+    return finish_download(rid, data, file_dt, cache, cache_key, listing_cache)
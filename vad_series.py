@@ -0,0 +1,128 @@
+from __future__ import print_function
+
+import numpy as np
+
+from datetime import datetime, timedelta
+
+from params import compute_parameters, Profile, vec2comp, comp2vec
+
+_epoch = datetime(1970, 1, 1, 0, 0, 0)
+
+_scalar_params = ['critical', 'shear_mag_1000m', 'shear_mag_3000m', 'shear_mag_6000m', 'srh_1000m', 'srh_3000m']
+_vector_params = ['bunkers_right', 'bunkers_left', 'mean_wind', 'storm_motion']
+
+
+class ParameterSeries(object):
+    def __init__(self, radar_id, capacity=36, storm_motion='right-mover'):
+        self.radar_id = radar_id
+        self.capacity = capacity
+        self.storm_motion = storm_motion
+
+        self._times = np.zeros(capacity)
+        self._profiles = [ None ] * capacity
+        self._values = {}
+        for name in _scalar_params:
+            self._values[name] = np.nan * np.ones(capacity)
+        for name in _vector_params:
+            self._values[name] = np.nan * np.ones((2, capacity))
+
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, vad):
+        valid_time = (vad['time'] - _epoch).total_seconds()
+        if self._count > 0 and valid_time <= self._times[self._head - 1]:
+            # Already have this one (or something newer)
+            return False
+
+        prof = Profile(vad)
+        params = compute_parameters(prof, self.storm_motion)
+
+        idx = self._head
+        self._times[idx] = valid_time
+        self._profiles[idx] = prof
+
+        for name in _scalar_params:
+            self._values[name][idx] = params[name]
+        for name in _vector_params:
+            self._values[name][:, idx] = vec2comp(*params[name])
+
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def times(self):
+        return [ _epoch + timedelta(seconds=t) for t in self._times[self._order()] ]
+
+    def profiles(self):
+        return [ self._profiles[idx] for idx in self._order() ]
+
+    def values(self, name):
+        vals = self._values[name][..., self._order()]
+        if name in _vector_params:
+            vals = comp2vec(*vals)
+        return vals
+
+    def latest(self):
+        if self._count == 0:
+            return None
+        return self._params_at(self._order()[-1])
+
+    def trend(self, name, minutes, tolerance=10):
+        order = self._order()
+        if len(order) == 0:
+            return None
+
+        times = self._times[order]
+        target = times[-1] - minutes * 60
+        idx_then = np.searchsorted(times, target, side='right') - 1
+        if idx_then < 0 or times[idx_then] < target - tolerance * 60:
+            # Not enough history, or there's a gap in the data and the closest one is from well before the window
+            return None
+
+        then = self._values[name][..., order[idx_then]]
+        change = self._values[name][..., order[-1]] - then
+        if name in _vector_params:
+            change = comp2vec(*change)
+        return change
+
+    def _order(self):
+        # Ring buffer indices, oldest first
+        return (np.arange(self._head - self._count, self._head)) % self.capacity
+
+    def _params_at(self, idx):
+        params = {}
+        for name in _scalar_params:
+            params[name] = self._values[name][idx]
+        for name in _vector_params:
+            params[name] = comp2vec(*self._values[name][:, idx])
+        return params
+
+
+class ParameterService(object):
+    def __init__(self, capacity=36, storm_motion='right-mover'):
+        self._capacity = capacity
+        self._storm_motion = storm_motion
+        self._series = {}
+
+    def add(self, radar_id, vad):
+        return self.series(radar_id).add(vad)
+
+    def series(self, radar_id):
+        try:
+            series = self._series[radar_id]
+        except KeyError:
+            series = self._series[radar_id] = ParameterSeries(radar_id, capacity=self._capacity,
+                                                              storm_motion=self._storm_motion)
+        return series
+
+    def trends(self, radar_id, minutes=(30, 60), tolerance=10):
+        series = self.series(radar_id)
+        trends = {}
+        for mins in minutes:
+            trends[mins] = dict((name, series.trend(name, mins, tolerance=tolerance))
+                                for name in _scalar_params + _vector_params)
+        return trends
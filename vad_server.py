@@ -0,0 +1,163 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import sys
+import json
+import signal
+import argparse
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from ftp_pool import FTPPool
+from params import compute_parameters, Profile
+from plot import HodographPlot
+from hodo_scene import is_scene_file, write_hodograph
+from vad import parse_time, parse_vector, load_vad
+
+
+class RenderServer(object):
+    def __init__(self, output='.', local_path=None, cache_path=None, index_path=None):
+        # Where the data come from and where the images go are up to whoever started the server, not the clients.
+        self._output = os.path.realpath(output)
+        self._local_path = local_path
+        self._index_path = index_path
+        self._cache_path = cache_path
+        self._hodo = HodographPlot()
+        self._pool = FTPPool()
+
+    def close(self):
+        self._hodo.close()
+        self._pool.close()
+
+    def handle(self, request):
+        try:
+            response = self._render(request)
+        except Exception:
+            typ, val, trace = sys.exc_info()
+            response = {'error': "%s: %s" % (typ.__name__, val)}
+        return response
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return json.dumps({'error': "Couldn't decode request."})
+        return json.dumps(self.handle(request))
+
+    def _output_path(self, fname):
+        # The name can't get out of the output directory, whether by way of .., an absolute path, or a symlink.
+        path = os.path.realpath(os.path.join(self._output, fname))
+        if not path.startswith(self._output + os.sep):
+            raise ValueError("'%s' isn't in the output directory." % fname)
+        return path
+
+    def _render(self, request):
+        for key in [ 'local_path', 'cache_path' ]:
+            if key in request:
+                raise ValueError("'%s' can only be set when starting the server." % key)
+
+        radar_id = request['radar_id'].upper()
+        local_path = self._local_path
+        fname = self._output_path(request.get('fname') or "%s_vad.png" % radar_id)
+
+        plot_time = None
+        if request.get('time'):
+            plot_time = parse_time(request['time'])
+        elif local_path is not None:
+            raise ValueError("'time' is required when loading from the local disk.")
+
+        vad = load_vad(radar_id, plot_time, local_path=local_path, cache_path=self._cache_path, pool=self._pool,
+                       index_path=self._index_path)
+
+        if request.get('sfc_wind'):
+            vad.add_surface_wind(parse_vector(request['sfc_wind']))
+
+        prof = Profile(vad)
+        params = compute_parameters(prof, request.get('storm_motion', 'right-mover'))
+
+        if is_scene_file(fname):
+            bounds = write_hodograph(prof, params, fname, fixed=request.get('fixed', False))
+        else:
+            bounds = self._hodo.render(prof, params, fname=fname, web=request.get('web', False),
+                                       fixed=request.get('fixed', False), archive=(local_path is not None))
+
+        return {
+            'radar_id': radar_id,
+            'valid_time': vad['time'].strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'filename': fname,
+            'bounds': bounds,
+        }
+
+
+def _make_handler(server):
+    class RenderHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode('utf-8').strip()
+                if line:
+                    self.wfile.write((server.handle_line(line) + "\n").encode('utf-8'))
+                    self.wfile.flush()
+
+    return RenderHandler
+
+
+def serve_stdin(server):
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            print(server.handle_line(line))
+            sys.stdout.flush()
+
+
+def serve_socket(server, socket_path=None, port=None):
+    # Requests are handled one at a time, since they all draw on the same figure.
+    handler = _make_handler(server)
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        listener = socketserver.UnixStreamServer(socket_path, handler)
+    else:
+        listener = socketserver.TCPServer(('127.0.0.1', port), handler)
+
+    try:
+        listener.serve_forever()
+    finally:
+        listener.server_close()
+        if socket_path is not None:
+            os.remove(socket_path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-s', '--socket', dest='socket_path', help="Path to a Unix socket on which to listen. If neither this nor -P is given, read requests from stdin.")
+    ap.add_argument('-P', '--port', dest='port', type=int, help="Port on localhost on which to listen.")
+    ap.add_argument('-o', '--output', dest='output', default='.', help="Path in which to put the images. The file names in the requests are taken to be inside this path.")
+    ap.add_argument('-p', '--local-path', dest='local_path', help="Path to local data. If given, the VWPs are loaded from here instead of downloaded.")
+    ap.add_argument('-I', '--index-path', dest='index_path', help="File in which to keep the index of the local data. Defaults to the same as in vad.py.")
+    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here.")
+    args = ap.parse_args()
+
+    np.seterr(all='ignore')
+
+    # Make sure the socket gets cleaned up when we're killed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = RenderServer(output=args.output, local_path=args.local_path, cache_path=args.cache_path,
+                          index_path=args.index_path)
+    try:
+        if args.socket_path is None and args.port is None:
+            serve_stdin(server)
+        else:
+            serve_socket(server, socket_path=args.socket_path, port=args.port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+from __future__ import print_function
+
+import numpy as np
+
+import os
+import json
+from datetime import datetime, timedelta
+
+from vad_reader import VADFile
+
+"""
+Columnar store for decoded VWPs. Each radar and day is a directory (<root>/<RADAR_ID>/<YYYYMMDD>) holding one raw
+little-endian float32 file per column, with the levels of every profile back to back. Alongside those are the end
+offset of each profile into the columns and the valid time of each profile (int64 seconds since 1970), and a small
+JSON file with the number of profiles and levels. The JSON file is written last, so a reader never sees a partial
+append. Everything past the counts in it is left over from an append that didn't finish and gets overwritten by the
+next one. Only one process should append to a store at a time.
+"""
+
+_columns = VADFile.fields + ['altitude']
+_col_dtype = np.dtype('<f4')
+_key_dtype = np.dtype('<i8')
+
+_meta_name = "meta.json"
+_offsets_name = "offsets.i8"
+_times_name = "time.i8"
+
+_epoch = datetime(1970, 1, 1, 0, 0, 0)
+
+
+def _to_seconds(dt):
+    return int((dt - _epoch).total_seconds())
+
+
+def _read_meta(day_path):
+    try:
+        with open(os.path.join(day_path, _meta_name)) as fmeta:
+            return json.load(fmeta)
+    except IOError:
+        return {'count': 0, 'levels': 0}
+
+
+def _write_meta(day_path, meta):
+    tmp_name = os.path.join(day_path, ".tmp.%s" % _meta_name)
+    with open(tmp_name, 'w') as ftmp:
+        json.dump(meta, ftmp)
+        ftmp.flush()
+        os.fsync(ftmp.fileno())
+    os.rename(tmp_name, os.path.join(day_path, _meta_name))
+
+
+def _map(path, dtype, count):
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def _write_at(path, offset, data):
+    # Overwrite from offset on, which throws away anything left by an unfinished append.
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    fout = open(path, mode)
+    try:
+        fout.seek(offset)
+        fout.truncate()
+        fout.write(data.tobytes())
+        fout.flush()
+        os.fsync(fout.fileno())
+    finally:
+        fout.close()
+
+
+class StoreDay(object):
+    def __init__(self, day_path):
+        meta = _read_meta(day_path)
+        self.path = day_path
+        self.radar_id = meta.get('radar_id')
+        self.count = meta['count']
+        self.levels = meta['levels']
+
+        self.ends = _map(os.path.join(day_path, _offsets_name), _key_dtype, self.count)
+        self.starts = np.concatenate([ [ 0 ], self.ends ])[:-1].astype(_key_dtype)
+        self.times = _map(os.path.join(day_path, _times_name), _key_dtype, self.count)
+
+        self._columns = {}
+        for col in _columns:
+            self._columns[col] = _map(os.path.join(day_path, "%s.f4" % col), _col_dtype, self.levels)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, col):
+        return self._columns[col]
+
+    def valid_times(self):
+        return [ _epoch + timedelta(seconds=int(secs)) for secs in self.times ]
+
+    def profile(self, idx):
+        start, end = self.starts[idx], self.ends[idx]
+        prof = dict((col, self._columns[col][start:end]) for col in _columns)
+        prof['time'] = _epoch + timedelta(seconds=int(self.times[idx]))
+        return prof
+
+
+class VADStore(object):
+    columns = _columns
+
+    def __init__(self, root):
+        self.root = root
+
+    def append(self, radar_id, vad):
+        return self.append_many(radar_id, [ vad ]) == 1
+
+    def append_many(self, radar_id, vads):
+        by_day = {}
+        for vad in vads:
+            by_day.setdefault(vad['time'].strftime("%Y%m%d"), []).append(vad)
+
+        num_added = 0
+        for day, day_vads in sorted(by_day.items()):
+            num_added += self._append_day(radar_id, day, day_vads)
+        return num_added
+
+    def radars(self):
+        return sorted(rid for rid in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, rid)))
+
+    def days(self, radar_id):
+        rid_path = os.path.join(self.root, radar_id)
+        if not os.path.isdir(rid_path):
+            return []
+        return sorted(day for day in os.listdir(rid_path) if os.path.exists(os.path.join(rid_path, day, _meta_name)))
+
+    def day(self, radar_id, date):
+        day_path = os.path.join(self.root, radar_id, date.strftime("%Y%m%d"))
+        if not os.path.exists(os.path.join(day_path, _meta_name)):
+            return None
+        return StoreDay(day_path)
+
+    def iter_days(self, radar_id=None):
+        radar_ids = self.radars() if radar_id is None else [ radar_id ]
+        for rid in radar_ids:
+            for day in self.days(rid):
+                yield StoreDay(os.path.join(self.root, rid, day))
+
+    def _append_day(self, radar_id, day, vads):
+        day_path = os.path.join(self.root, radar_id, day)
+        try:
+            os.makedirs(day_path)
+        except OSError:
+            if not os.path.isdir(day_path):
+                raise
+
+        meta = _read_meta(day_path)
+        stored = set(_map(os.path.join(day_path, _times_name), _key_dtype, meta['count']).tolist())
+
+        # Appending the same VWP again does nothing, so re-running an export is harmless.
+        new_vads = []
+        for vad in vads:
+            secs = _to_seconds(vad['time'])
+            if secs not in stored:
+                stored.add(secs)
+                new_vads.append((secs, vad))
+
+        if len(new_vads) == 0:
+            return 0
+
+        num_levels = np.array([ len(vad['altitude']) for secs, vad in new_vads ])
+        for col in _columns:
+            col_data = np.concatenate([ np.asarray(vad[col], dtype=_col_dtype) for secs, vad in new_vads ])
+            _write_at(os.path.join(day_path, "%s.f4" % col), meta['levels'] * _col_dtype.itemsize, col_data)
+
+        ends = (meta['levels'] + np.cumsum(num_levels)).astype(_key_dtype)
+        times = np.array([ secs for secs, vad in new_vads ], dtype=_key_dtype)
+        _write_at(os.path.join(day_path, _offsets_name), meta['count'] * _key_dtype.itemsize, ends)
+        _write_at(os.path.join(day_path, _times_name), meta['count'] * _key_dtype.itemsize, times)
+
+        _write_meta(day_path, {
+            'radar_id': radar_id,
+            'date': day,
+            'count': meta['count'] + len(new_vads),
+            'levels': int(ends[-1]),
+            'columns': _columns,
+        })
+        return len(new_vads)
@@ -0,0 +1,128 @@
+from __future__ import print_function
+
+import numpy as np
+
+import matplotlib as mpl
+mpl.use('agg')
+import pylab
+from matplotlib.dates import date2num, DateFormatter, HourLocator, MinuteLocator
+
+import argparse
+from datetime import timedelta
+
+from ftp_pool import FTPPool
+from params import stack_profiles, regrid_batch
+from vad import parse_time, load_vad_range
+from vad_reader import find_file_times
+
+_default_hghts = np.arange(0.5, 12.01, 0.5)
+
+
+def time_height_grid(vads, hghts=_default_hghts):
+    wind_dir, wind_spd, altitude, mask = stack_profiles(vads)
+    u, v = regrid_batch(wind_dir, wind_spd, altitude, hghts, mask=mask)
+    return [ vad['time'] for vad in vads ], u, v
+
+
+def plot_time_height(vads, fname, hghts=_default_hghts, max_columns=48):
+    times, u, v = time_height_grid(vads, hghts)
+    radar_id = vads[0].rid
+
+    # Thin out the columns so the barbs don't run into each other on long time ranges.
+    stride = int(np.ceil(len(times) / float(max_columns)))
+    col_times = date2num(times[::stride])
+    u = u[::stride]
+    v = v[::stride]
+
+    col_time_grid, hght_grid = np.meshgrid(col_times, hghts, indexing='ij')
+    spd = np.hypot(u, v)
+    valid = ~np.isnan(spd)
+
+    pylab.figure(figsize=(12, 6), dpi=150)
+
+    barbs = pylab.barbs(col_time_grid[valid], hght_grid[valid], u[valid], v[valid], spd[valid], cmap='viridis',
+                        clim=(0, 100), length=5, linewidth=0.75)
+    pylab.colorbar(barbs, pad=0.02).set_label("Wind Speed (kts)")
+
+    col_spacing = col_times[1] - col_times[0] if len(col_times) > 1 else 5. / (24 * 60)
+    hght_spacing = hghts[1] - hghts[0] if len(hghts) > 1 else 0.5
+    pylab.xlim(col_times[0] - col_spacing, col_times[-1] + col_spacing)
+    pylab.ylim(max(0, hghts[0] - hght_spacing), hghts[-1] + hght_spacing)
+
+    # Ticks on round times, about eight of them
+    hours = (times[-1] - times[0]).total_seconds() / 3600.
+    if hours > 4:
+        locator = HourLocator(byhour=range(0, 24, int(np.ceil(hours / 8.))))
+    else:
+        tick_mins = [ mins for mins in [ 5, 10, 15, 30, 60 ] if mins >= hours * 60 / 8. ][0]
+        locator = MinuteLocator(byminute=range(0, 60, tick_mins))
+    pylab.gca().xaxis.set_major_locator(locator)
+    pylab.gca().xaxis.set_major_formatter(DateFormatter("%H%M"))
+    pylab.xlabel("Time (UTC)")
+    pylab.ylabel("Altitude (km)")
+    pylab.grid(color='#cccccc', linestyle='-', linewidth=0.5)
+
+    pylab.title("%s VWP %s - %s" % (radar_id, times[0].strftime("%d %b %Y %H%M"), times[-1].strftime("%d %b %Y %H%M UTC")))
+
+    pylab.savefig(fname)
+    pylab.close()
+
+
+def vad_timeheight(radar_id, time=None, length=12, top=12., fname=None, local_path=None, cache_path=None,
+                   max_columns=48, index_path=None):
+    if fname is None:
+        fname = "%s_vwp.png" % radar_id
+
+    with FTPPool() as ftp_pool:
+        if time:
+            end = parse_time(time)
+        elif local_path is not None:
+            raise ValueError("'-t' ('--time') argument is required when loading from the local disk.")
+        else:
+            end = find_file_times(radar_id, pool=ftp_pool)[0][1]
+
+        start = end - timedelta(hours=length)
+        vads = load_vad_range(radar_id, start, end, local_path=local_path, cache_path=cache_path, pool=ftp_pool,
+                              index_path=index_path)
+
+    if len(vads) == 0:
+        raise ValueError("No VAD files between %s and %s." % (start.strftime("%d %B %Y %H%M UTC"), end.strftime("%d %B %Y %H%M UTC")))
+
+    hghts = np.arange(0.5, top + 0.01, 0.5)
+    plot_time_height(vads, fname, hghts=hghts, max_columns=max_columns)
+    return vads
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('radar_id', help="The 4-character identifier for the radar (e.g. KTLX, KFWS, etc.)")
+    ap.add_argument('-t', '--time', dest='time', help="End time of the plot. Takes the form DD/HHMM, where DD is the day, HH is the hour, and MM is the minute. Defaults to the latest VWP.")
+    ap.add_argument('-l', '--length', dest='length', type=float, default=12, help="Length of the plot in hours.")
+    ap.add_argument('-z', '--top', dest='top', type=float, default=12., help="Top of the plot in km.")
+    ap.add_argument('-f', '--img-name', dest='img_name', help="Name of the file produced. Defaults to <RADAR_ID>_vwp.png.")
+    ap.add_argument('-p', '--local-path', dest='local_path', help="Path to local data. If not given, download from the Internet.")
+    ap.add_argument('-I', '--index-path', dest='index_path', help="File in which to keep the index of the local data. Defaults to the same as in vad.py.")
+    ap.add_argument('-c', '--cache-path', dest='cache_path', help="Path to local cache. Data downloaded from the Internet will be cached here, and read from here if already downloaded.")
+    ap.add_argument('-n', '--max-columns', dest='max_columns', type=int, default=48, help="Maximum number of columns of barbs. Longer time ranges are thinned out to this many.")
+    args = ap.parse_args()
+
+    np.seterr(all='ignore')
+
+    radar_id = args.radar_id.upper()
+    print("Plotting VWP time-height for %s ..." % radar_id)
+
+    vads = vad_timeheight(radar_id,
+        time=args.time,
+        length=args.length,
+        top=args.top,
+        fname=args.img_name,
+        local_path=args.local_path,
+        index_path=args.index_path,
+        cache_path=args.cache_path,
+        max_columns=args.max_columns
+    )
+
+    print("Valid times: %s to %s (%d VWPs)" % (vads[0]['time'].strftime("%d %B %Y %H%M UTC"), vads[-1]['time'].strftime("%d %B %Y %H%M UTC"), len(vads)))
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import re
+from datetime import datetime
+
 _radar_info = {
     # WSR-88Ds
     'KABR': {'wfo': 'KABR', 'region': 3},
@@ -204,9 +207,47 @@ _radar_info = {
     'TSJU': {'wfo': 'TJSJ', 'region': 2},
 }
 
+def all_radar_ids():
+    return sorted(_radar_info.keys())
+
 def build_has_name(radar_id, scan_time):
     radar_info = _radar_info[radar_id]
 
     iname = "%s_SDUS3%d_NVW%s_%s" % (radar_info['wfo'], radar_info['region'], radar_id[1:], 
                                      scan_time.strftime("%Y%m%d%H%M"))
     return iname
+
+_has_name_re = re.compile(r"([\w]{4})_SDUS3([\d])_NVW([\w]{3})_([\d]{12})")
+_has_radar_ids = None
+
+def parse_has_name(iname):
+    global _has_radar_ids
+
+    match = _has_name_re.search(iname)
+    if match is None:
+        raise ValueError("'%s' isn't a VWP file name." % iname)
+
+    if _has_radar_ids is None:
+        _has_radar_ids = dict(((info['wfo'], info['region'], rid[1:]), rid) for rid, info in _radar_info.items())
+
+    wfo, region, site, time_str = match.groups()
+    try:
+        radar_id = _has_radar_ids[(wfo, int(region), site)]
+    except KeyError:
+        raise ValueError("Unknown radar in file name '%s'." % iname)
+
+    scan_time = datetime.strptime(time_str, "%Y%m%d%H%M")
+    return radar_id, scan_time
+
+_wmo_radar_ids = None
+
+def parse_wmo_header(office, awips_id):
+    global _wmo_radar_ids
+
+    if _wmo_radar_ids is None:
+        _wmo_radar_ids = dict(((info['wfo'], rid[1:]), rid) for rid, info in _radar_info.items())
+
+    try:
+        return _wmo_radar_ids[(office, awips_id[3:])]
+    except KeyError:
+        raise ValueError("Unknown radar for '%s' from %s." % (awips_id, office))